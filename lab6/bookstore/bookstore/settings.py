@@ -53,6 +53,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'bookstore_app.middleware.HashingBusyMiddleware',
 ]
 
 ROOT_URLCONF = 'bookstore.urls'
@@ -93,6 +94,88 @@ DATABASES = {
     }
 }
 
+# Кэш фрагментов списка книг, числа найденных книг и бестселлеров. Его
+# ключи включают версию каталога из таблицы counter (см. caching.py),
+# поэтому кэш может быть у каждого рабочего процесса своим: LocMemCache не
+# обращается к БД ни при чтении, ни при записи. Общее для процессов
+# состояние — версия каталога, счётчики статистики и ключи идемпотентности —
+# хранится в таблицах БД. Чтобы процессы делили и сами фрагменты, в
+# production можно взять Redis (django.core.cache.backends.redis.RedisCache).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bookstore',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+# Как часто (в секундах) рабочий процесс переносит накопленные счётчики
+# статистики в таблицу counter
+BOOK_COUNTER_FLUSH_INTERVAL = 10
+
+# Поиск по каталогу: путь к классу бэкенда из bookstore_app.search
+# или None, чтобы бэкенд выбирался по СУБД
+BOOK_SEARCH_BACKEND = None
+# Сортировать результаты поиска по релевантности, а не по названию
+BOOK_SEARCH_RANKED = False
+# Пагинация каталога: 'numbered' (OFFSET + COUNT), 'keyset' (курсоры по
+# (title, id)) или 'auto' — нумерованные страницы только для выборок не
+# длиннее BOOK_LIST_NUMBERED_MAX_ROWS
+BOOK_LIST_PAGINATION = 'auto'
+BOOK_LIST_NUMBERED_MAX_ROWS = 1000
+# Сколько секунд хранить в кэше число найденных книг
+BOOK_COUNT_CACHE_TIMEOUT = 300
+# Выше этого числа строк вместо COUNT(*) берётся оценка планировщика
+# (только PostgreSQL); None отключает оценку
+BOOK_COUNT_ESTIMATE_THRESHOLD = 100000
+# Сколько секунд хранить HTML-фрагмент списка книг; 0 отключает кэш
+BOOK_FRAGMENT_CACHE_TIMEOUT = 600
+# Размер страницы JSON API каталога по умолчанию и максимальный
+BOOK_API_PAGE_SIZE = 20
+BOOK_API_MAX_PAGE_SIZE = 100
+# Максимум подсказок при вводе и как часто (в секундах) индекс подсказок
+# сверяет свою версию с версией каталога
+BOOK_SUGGEST_LIMIT = 10
+BOOK_SUGGEST_CHECK_INTERVAL = 5
+# Сколько секунд одинаковый запрос каталога ждёт уже выполняющийся;
+# 0 отключает объединение запросов
+BOOK_SINGLEFLIGHT_TIMEOUT = 5
+
+# Хранилище корзины: ServerCartStore (таблица cart_item) или
+# CookieCartStore (cookie до 4 КБ)
+BOOK_CART_BACKEND = 'bookstore_app.carts.ServerCartStore'
+# Максимум разных книг в одном запросе add-to-cart/batch/
+BOOK_CART_BATCH_LIMIT = 200
+# Заказов на странице истории заказов
+BOOK_ORDER_HISTORY_PAGE_SIZE = 10
+
+# Фоновые задачи (bookstore_app.jobs): сколько раз повторять упавшую задачу
+# и через сколько секунд считать зависшей задачу, взятую в работу
+BOOK_JOB_MAX_ATTEMPTS = 5
+BOOK_JOB_STALE_TIMEOUT = 600
+# Сколько секунд помнить ответы на запросы с ключом идемпотентности и сколько
+# секунд повтор ждёт завершения первого запроса
+BOOK_IDEMPOTENCY_TTL = 24 * 60 * 60
+BOOK_IDEMPOTENCY_WAIT = 10
+# Сколько секунд ключ считается занятым выполняющимся запросом; должно быть
+# чуть больше таймаута запроса на сервере приложений
+BOOK_IDEMPOTENCY_LOCK_TIMEOUT = 60
+# Бестселлеры: за сколько последних дней, сколько книг и сколько секунд
+# хранить список в кэше
+BOOK_BESTSELLERS_DAYS = 30
+BOOK_BESTSELLERS_LIMIT = 10
+BOOK_BESTSELLERS_CACHE_TIMEOUT = 300
+# Дневные продажи старше этого числа дней sales_rollup --compact сворачивает
+# в месячные
+BOOK_SALES_COMPACT_DAYS = 90
+# Хэширование паролей (bookstore_app.hashing): число процессов пула (0 —
+# хэшировать в потоке запроса) и сколько вычислений может ждать в очереди,
+# прежде чем запросы начнут получать 503
+BOOK_HASHING_WORKERS = 2
+BOOK_HASHING_MAX_QUEUE = 16
+
+# Письма (подтверждения заказов) выводятся в консоль процесса run_jobs
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -113,6 +196,7 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 PASSWORD_HASHERS = [
+    'bookstore_app.hashers.CustomSHA256V2PasswordHasher',
     'bookstore_app.hashers.CustomSHA256PasswordHasher',
     'django.contrib.auth.hashers.Argon2PasswordHasher',
     'django.contrib.auth.hashers.PBKDF2PasswordHasher',
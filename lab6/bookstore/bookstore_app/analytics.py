@@ -0,0 +1,161 @@
+"""
+Сводки продаж для блока бестселлеров и отчёта для персонала.
+
+Таблица book_sales хранит количество и выручку по книге за день, поэтому
+бестселлеры за последние N дней читают не больше N строк на книгу, а не
+все строки заказов. Строки обновляются сразу после фиксации транзакции
+оформления заказа (см. orders.create_order): в самой транзакции блокировка
+строки (книга, день) бестселлера выстраивала бы параллельные заказы
+в очередь. Если процесс упадёт между фиксацией и обновлением, продажи
+восстановит sales_rollup --backfill. Команда sales_rollup пересчитывает
+дни по заказам (--backfill) и сворачивает старые дни в месячные строки
+(--compact), чтобы таблица не росла без предела.
+
+Очистка истории заказов покупателем продажи не отменяет: сводки
+описывают то, что было продано. Поэтому заказы при очистке только
+помечаются (Order.deleted_at) и учитываются при пересчёте сводки. По той же
+причине строки хранят название и автора книги, а при её удалении остаются
+со ссылкой NULL.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import BookSales, OrderItem
+
+
+def add_sales(book_id, title, author, period, period_start, quantity,
+              revenue):
+    """Прибавляет продажи к строке сводки, создавая её при необходимости.
+    Строки удалённых книг (book_id=None) различаются названием и
+    автором."""
+    rows = BookSales.objects.filter(period=period, period_start=period_start)
+    if book_id is None:
+        rows = rows.filter(book__isnull=True, title=title, author=author)
+    else:
+        rows = rows.filter(book_id=book_id)
+    changes = {'quantity': F('quantity') + quantity,
+               'revenue': F('revenue') + revenue}
+    if rows.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            BookSales.objects.create(book_id=book_id, title=title,
+                                     author=author, period=period,
+                                     period_start=period_start,
+                                     quantity=quantity, revenue=revenue)
+    except IntegrityError:
+        # Строку только что создал параллельный заказ
+        rows.update(**changes)
+
+
+def record_order_sales(order, lines):
+    """Добавляет строки заказа к дневной сводке после фиксации текущей
+    транзакции (вне транзакции — сразу)."""
+    day = timezone.localdate(order.created_at)
+    totals = defaultdict(lambda: [0, 0])
+    names = {}
+    for line in lines:
+        if line['book_id'] is not None:
+            totals[line['book_id']][0] += line['quantity']
+            totals[line['book_id']][1] += line['cost'] * line['quantity']
+            names[line['book_id']] = (line['title'], line['author'])
+
+    def record():
+        # Каждая строка обновляется отдельным коротким запросом, в порядке
+        # book_id
+        for book_id in sorted(totals):
+            quantity, revenue = totals[book_id]
+            add_sales(book_id, *names[book_id], BookSales.DAY, day,
+                      quantity, revenue)
+    transaction.on_commit(record)
+
+
+def recent_sales(days):
+    return BookSales.objects.filter(
+        period=BookSales.DAY,
+        period_start__gt=timezone.localdate() - timedelta(days=days))
+
+
+def get_bestsellers(days=30, limit=10):
+    """Книги, больше всего продававшиеся за последние days дней:
+    [{'book_id', 'title', 'author', 'quantity', 'revenue'}]. У
+    существующих книг берётся текущее название, у удалённых (book_id None)
+    — сохранённое в сводке."""
+    return [{
+        'book_id': row['book'],
+        'title': row['book_title'],
+        'author': row['book_author'],
+        'quantity': row['total_quantity'],
+        'revenue': row['total_revenue'],
+    } for row in recent_sales(days).annotate(
+        book_title=Coalesce('book__title', 'title'),
+        book_author=Coalesce('book__author', 'author')).values(
+        'book', 'book_title', 'book_author').annotate(
+        total_quantity=Sum('quantity'), total_revenue=Sum('revenue'))
+        .order_by('-total_quantity', 'book_title')[:limit]]
+
+
+def get_daily_sales(days=30):
+    """Продажи по дням за последние days дней, новые первыми."""
+    return list(recent_sales(days).values('period_start').annotate(
+        total_quantity=Sum('quantity'), total_revenue=Sum('revenue'))
+        .order_by('-period_start'))
+
+
+def backfill_sales(since=None):
+    """Пересчитывает сводку по заказам начиная с месяца, в который попадает
+    дата since (или за всё время): строки периода удаляются, включая
+    месячные, и записываются заново по дням. Заказы, перенесённые из
+    cookie, не учитываются, а убранные покупателями из истории —
+    учитываются. Возвращает число записанных строк."""
+    items = OrderItem.objects.filter(order__imported=False)
+    rollups = BookSales.objects.all()
+    if since is not None:
+        # С начала месяца, чтобы не сложить дни с месячной строкой
+        since = since.replace(day=1)
+        items = items.filter(order__created_at__date__gte=since)
+        rollups = rollups.filter(period_start__gte=since)
+    items = items.annotate(day=TruncDate('order__created_at'))
+    totals = {'total_quantity': Sum('quantity'),
+              'total_revenue': Sum(F('cost') * F('quantity'))}
+    # Существующие книги — по ссылке и текущему названию, удалённые — по
+    # названию и автору из строк заказа
+    rows = [(row['book'], row['book__title'], row['book__author'], row)
+            for row in items.filter(book__isnull=False).values(
+                'book', 'book__title', 'book__author', 'day')
+            .annotate(**totals).order_by()]
+    rows += [(None, row['title'], row['author'], row)
+             for row in items.filter(book__isnull=True).values(
+                 'title', 'author', 'day').annotate(**totals).order_by()]
+    with transaction.atomic():
+        rollups.delete()
+        created = BookSales.objects.bulk_create([
+            BookSales(book_id=book_id, title=title, author=author,
+                      period=BookSales.DAY, period_start=row['day'],
+                      quantity=row['total_quantity'],
+                      revenue=row['total_revenue'])
+            for book_id, title, author, row in rows], batch_size=1000)
+    return len(created)
+
+
+def compact_sales(older_than_days):
+    """Сворачивает дневные строки старше older_than_days дней в месячные.
+    Возвращает число удалённых дневных строк."""
+    cutoff = timezone.localdate() - timedelta(days=older_than_days)
+    old_days = BookSales.objects.filter(period=BookSales.DAY,
+                                        period_start__lt=cutoff)
+    with transaction.atomic():
+        months = old_days.annotate(month=TruncMonth('period_start')).values(
+            'book', 'title', 'author', 'month').annotate(
+            total_quantity=Sum('quantity'), total_revenue=Sum('revenue'))
+        for row in months.order_by('book', 'title', 'author', 'month'):
+            add_sales(row['book'], row['title'], row['author'],
+                      BookSales.MONTH, row['month'],
+                      row['total_quantity'], row['total_revenue'])
+        deleted, _ = old_days.delete()
+    return deleted
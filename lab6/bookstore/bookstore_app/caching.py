@@ -0,0 +1,213 @@
+"""
+Версия каталога для инвалидации кэшей, время последнего изменения каталога
+для условных GET-запросов, кэш HTML-фрагментов списка книг и счётчики
+статистики.
+
+Любое изменение книги увеличивает счётчик версии (см. signals.py), а
+кэшированные значения хранятся под ключами, включающими версию, поэтому
+после изменения каталога старые записи просто перестают читаться и
+вытесняются по таймауту.
+
+Версия и время изменения каталога хранятся в таблице counter, и версия
+увеличивается атомарным UPDATE ... SET value = value + 1: все рабочие
+процессы видят одну версию, а одновременные изменения книг не теряют
+увеличений. Сам кэш (CACHES) поэтому может быть у каждого процесса своим —
+ключ с версией не даст прочитать устаревшую запись.
+
+Счётчики статистики (кэш фрагментов, single-flight, хэширование паролей)
+копятся в памяти процесса и переносятся в таблицу counter не чаще раза в
+BOOK_COUNTER_FLUSH_INTERVAL секунд, а не записываются в БД на каждом
+запросе. Команды статистики видят их с этой задержкой; накопленное с
+последнего переноса теряется, если процесс завершится.
+"""
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+
+from .models import Book, Counter
+
+CATALOG_VERSION = 'catalog_version'
+CATALOG_MODIFIED = 'catalog_modified'
+FRAGMENT_STATS_KEYS = {
+    'hits': 'bookstore:fragment_cache:hits',
+    'misses': 'bookstore:fragment_cache:misses',
+}
+
+# Счётчики статистики, ещё не перенесённые в таблицу counter
+_pending = defaultdict(int)
+_pending_lock = threading.Lock()
+_flushed_at = time.monotonic()
+# Потоки, в которых счётчики статистики не учитываются (discard_counters)
+_discarding = threading.local()
+
+
+def _add_to_counter(name, delta, initial=0):
+    """Атомарно прибавляет delta к счётчику name; отсутствующий счётчик
+    создаётся со значением initial + delta."""
+    counters = Counter.objects.filter(name=name)
+    if counters.update(value=F('value') + delta):
+        return
+    try:
+        with transaction.atomic():
+            Counter.objects.create(name=name, value=initial + delta)
+    except IntegrityError:
+        counters.update(value=F('value') + delta)
+
+
+def get_catalog_version():
+    version = Counter.objects.filter(name=CATALOG_VERSION) \
+        .values_list('value', flat=True).first()
+    if version is None:
+        # Начальное значение берётся из времени, чтобы после пересоздания
+        # таблицы не вернуться к версии, под которой в кэше остались записи
+        version = Counter.objects.get_or_create(
+            name=CATALOG_VERSION, defaults={'value': time.time_ns()})[0].value
+    return version
+
+
+def bump_catalog_version():
+    # Удаление книги не меняет max(updated_at), поэтому время изменения
+    # каталога запоминается отдельно
+    modified = int(time.time())
+    if not Counter.objects.filter(name=CATALOG_MODIFIED) \
+            .update(value=modified):
+        Counter.objects.get_or_create(name=CATALOG_MODIFIED,
+                                      defaults={'value': modified})
+    # UPDATE блокирует строку до конца транзакции, поэтому прочитано будет
+    # значение, записанное этим вызовом
+    with transaction.atomic():
+        _add_to_counter(CATALOG_VERSION, 1, initial=time.time_ns())
+        return Counter.objects.get(name=CATALOG_VERSION).value
+
+
+def get_catalog_last_modified():
+    """Возвращает время последнего изменения каталога (unix timestamp)."""
+    modified = Counter.objects.filter(name=CATALOG_MODIFIED) \
+        .values_list('value', flat=True).first()
+    if modified is None:
+        latest = Book.objects.aggregate(latest=Max('updated_at'))['latest']
+        modified = Counter.objects.get_or_create(
+            name=CATALOG_MODIFIED,
+            defaults={'value': int(latest.timestamp()) if latest else 0},
+        )[0].value
+    return modified
+
+
+def get_catalog_state():
+    """Возвращает (версия, время изменения) каталога одним запросом."""
+    values = dict(Counter.objects.filter(
+        name__in=(CATALOG_VERSION, CATALOG_MODIFIED),
+    ).values_list('name', 'value'))
+    version = values.get(CATALOG_VERSION)
+    modified = values.get(CATALOG_MODIFIED)
+    if version is None:
+        version = get_catalog_version()
+    if modified is None:
+        modified = get_catalog_last_modified()
+    return version, modified
+
+
+def _digest(parts):
+    raw = '\x00'.join(str(part) for part in parts).encode('utf-8')
+    return hashlib.md5(raw, usedforsecurity=False).hexdigest()
+
+
+def make_catalog_key(prefix, *parts, version=None):
+    """Собирает ключ кэша вида prefix:version:digest. Части ключа хэшируются,
+    чтобы пользовательский ввод не нарушал ограничений бэкенда кэша. Версию,
+    уже прочитанную в этом запросе, можно передать, чтобы не читать её
+    снова."""
+    if version is None:
+        version = get_catalog_version()
+    return f'bookstore:{prefix}:{version}:{_digest(parts)}'
+
+
+def make_catalog_etag(*parts, version=None):
+    """ETag, который меняется вместе с версией каталога."""
+    if version is None:
+        version = get_catalog_version()
+    return f'{version}-{_digest(parts)}'
+
+
+def incr_counter(name, delta=1):
+    """Увеличивает счётчик статистики в памяти процесса. Накопленное
+    переносится в таблицу counter не чаще раза в
+    BOOK_COUNTER_FLUSH_INTERVAL секунд."""
+    global _flushed_at
+    if getattr(_discarding, 'active', False):
+        return
+    with _pending_lock:
+        _pending[name] += delta
+        now = time.monotonic()
+        if now - _flushed_at < settings.BOOK_COUNTER_FLUSH_INTERVAL:
+            return
+        _flushed_at = now
+    flush_counters()
+
+
+@contextmanager
+def discard_counters():
+    """Внутри блока incr_counter в текущем потоке ничего не учитывает:
+    так замеры команд не попадают в общую статистику в таблице counter."""
+    previous = getattr(_discarding, 'active', False)
+    _discarding.active = True
+    try:
+        yield
+    finally:
+        _discarding.active = previous
+
+
+def flush_counters():
+    """Переносит накопленные в процессе счётчики в таблицу counter."""
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+    for name, delta in pending.items():
+        _add_to_counter(name, delta)
+
+
+def get_counters(names):
+    """Возвращает {имя: значение} для счётчиков статистики, учитывая
+    и ещё не перенесённое из этого процесса."""
+    flush_counters()
+    values = dict(Counter.objects.filter(name__in=names)
+                  .values_list('name', 'value'))
+    return {name: values.get(name, 0) for name in names}
+
+
+def reset_counters(names):
+    with _pending_lock:
+        for name in names:
+            _pending.pop(name, None)
+    Counter.objects.filter(name__in=names).delete()
+
+
+def get_cached_fragment(key):
+    """Возвращает HTML фрагмента из кэша и учитывает попадание/промах."""
+    html = cache.get(key)
+    outcome = 'hits' if html is not None else 'misses'
+    incr_counter(FRAGMENT_STATS_KEYS[outcome])
+    return html
+
+
+def set_cached_fragment(key, html, timeout):
+    cache.set(key, html, timeout)
+
+
+def get_fragment_cache_stats():
+    values = get_counters(list(FRAGMENT_STATS_KEYS.values()))
+    stats = {name: values[key] for name, key in FRAGMENT_STATS_KEYS.items()}
+    total = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / total if total else 0.0
+    return stats
+
+
+def reset_fragment_cache_stats():
+    reset_counters(list(FRAGMENT_STATS_KEYS.values()))
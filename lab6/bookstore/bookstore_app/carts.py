@@ -0,0 +1,416 @@
+"""
+Хранилища корзины.
+
+Корзина — это отображение book_id -> количество. Названия и цены в ней не
+хранятся: их подгружают из Book при показе корзины и оформлении заказа
+(см. pricing.py). Для каждой строки хранится только снимок цены, которую
+покупатель видел при добавлении, чтобы заметить её изменение.
+
+ServerCartStore хранит строки в таблице cart_item (ключ — пользователь или
+анонимный токен из cookie cart_token) и читает корзину одним запросом по
+индексу (owner, book) на каждый запрос, без кэша: кэш в памяти процесса у
+каждого рабочего процесса свой, и изменение, сделанное через другой
+процесс, было бы невидимо, а оформление заказа потеряло бы добавленные там
+книги. Изменения пишутся атомарными UPDATE ... SET quantity = quantity + n.
+Корзины гостей, к которым давно не обращались, удаляет команда
+purge_carts. CookieCartStore хранит корзину в подписанной
+cookie компактного двоичного формата (см. encode_cart_cookie) и ограничен
+4 КБ. Хранилище выбирается настройкой BOOK_CART_BACKEND.
+"""
+import base64
+import binascii
+import json
+import secrets
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import CartItem
+
+CART_TOKEN_COOKIE = 'cart_token'
+CART_COOKIE_MAX_AGE = 30 * 24 * 60 * 60  # 30 дней
+COOKIE_SIZE_LIMIT = 4096
+# 1 — пары (book_id, quantity), 2 — тройки (book_id, quantity, цена)
+CART_COOKIE_VERSION = 2
+CART_COOKIE_SALT = 'bookstore_app.carts'
+
+
+class CartTooLarge(Exception):
+    pass
+
+
+def _pack_varint(value, out):
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _unpack_varints(data):
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            yield value
+            value = shift = 0
+    if shift:
+        raise ValueError('Обрезанное число varint')
+
+
+def encode_cart_cookie(items, prices=None):
+    """Кодирует {book_id: quantity} и снимки цен {book_id: Decimal} в
+    подписанную строку: байт версии, затем тройки varint (book_id, quantity,
+    цена в копейках + 1, 0 — цена неизвестна) в base64url. Одна книга
+    занимает около восьми символов против ~80 в прежнем JSON с названием,
+    автором и ценой."""
+    prices = prices or {}
+    payload = bytearray([CART_COOKIE_VERSION])
+    for book_id, quantity in items.items():
+        price = prices.get(book_id)
+        _pack_varint(book_id, payload)
+        _pack_varint(quantity, payload)
+        _pack_varint(0 if price is None else int(price * 100) + 1, payload)
+    token = base64.urlsafe_b64encode(bytes(payload)).rstrip(b'=')
+    return signing.Signer(salt=CART_COOKIE_SALT).sign(token.decode('ascii'))
+
+
+def decode_cart_cookie(value):
+    """Обратное к encode_cart_cookie: возвращает (items, prices). Понимает
+    и прежние форматы (JSON и версию 1), чтобы корзины пользователей
+    пережили смену формата. Повреждённая или неподписанная cookie даёт
+    пустую корзину."""
+    if not value:
+        return {}, {}
+    if value.startswith('{'):
+        return _decode_legacy_cookie(value)
+    try:
+        token = signing.Signer(salt=CART_COOKIE_SALT).unsign(value)
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = list(_unpack_varints(data[1:]))
+    except (signing.BadSignature, binascii.Error, ValueError):
+        return {}, {}
+    # Чисел на книгу: в версии 1 цены не было
+    width = {1: 2, CART_COOKIE_VERSION: 3}.get(data[0]) if data else None
+    if width is None or len(values) % width:
+        return {}, {}
+    items, prices = {}, {}
+    for i in range(0, len(values), width):
+        book_id, quantity = values[i], values[i + 1]
+        price = values[i + 2] if width == 3 else 0
+        if quantity > 0:
+            items[book_id] = quantity
+            if price:
+                prices[book_id] = Decimal(price - 1) / 100
+    return items, prices
+
+
+def _decode_legacy_cookie(value):
+    items, prices = {}, {}
+    try:
+        # {"id": {"quantity": n, "cost": "...", ...}} или {"id": n}
+        for book_id, item in json.loads(value).items():
+            book_id = int(book_id)
+            if isinstance(item, dict):
+                items[book_id] = int(item['quantity'])
+                if 'cost' in item:
+                    prices[book_id] = Decimal(item['cost'])
+            else:
+                items[book_id] = int(item)
+    except (ValueError, TypeError, KeyError, AttributeError,
+            InvalidOperation):
+        return {}, {}
+    return items, prices
+
+
+def get_cart_cookie_name(request):
+    if request.user.is_authenticated:
+        return f'cart_{request.user.username}'
+    return 'cart__'
+
+
+class BaseCartStore:
+    def __init__(self, request):
+        self.request = request
+
+    def items(self):
+        """Возвращает {book_id: quantity}."""
+        raise NotImplementedError
+
+    def prices(self):
+        """Возвращает снимки цен {book_id: Decimal} для строк, где они
+        известны."""
+        raise NotImplementedError
+
+    def add(self, book_id, quantity=1, price=None):
+        """Увеличивает (или уменьшает при quantity < 0) количество книги.
+        Строка с неположительным количеством удаляется. price, если задана,
+        становится снимком цены строки."""
+        raise NotImplementedError
+
+    def add_many(self, quantities, prices=None):
+        """Добавляет сразу несколько книг: {book_id: quantity > 0} и снимки
+        цен {book_id: Decimal}."""
+        prices = prices or {}
+        for book_id, quantity in quantities.items():
+            self.add(book_id, quantity, prices.get(book_id))
+
+    def set(self, book_id, quantity):
+        raise NotImplementedError
+
+    def remove(self, book_id):
+        self.set(book_id, 0)
+
+    def remember_prices(self, prices):
+        """Обновляет снимки цен строк, которые уже есть в корзине, — после
+        того как покупателю показали новые цены."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def save(self, response):
+        """Записывает в ответ cookie, если хранилищу это нужно."""
+
+    def __len__(self):
+        return sum(self.items().values())
+
+    def __contains__(self, book_id):
+        return book_id in self.items()
+
+
+class ServerCartStore(BaseCartStore):
+    def __init__(self, request):
+        super().__init__(request)
+        self._items = None
+        self._prices = None
+        self._token = None
+        self._modified = False
+        if request.user.is_authenticated:
+            self.owner = f'user:{request.user.pk}'
+        else:
+            token = request.COOKIES.get(CART_TOKEN_COOKIE, '')
+            # Токен создаётся только при первом изменении корзины
+            if token.isalnum() and len(token) <= 43:
+                self._token = token
+            self.owner = f'anon:{self._token}' if self._token else None
+
+    def _load(self):
+        items, prices = {}, {}
+        if self.owner is None:
+            return items, prices
+        for book_id, quantity, price in CartItem.objects.filter(
+                owner=self.owner).order_by('id').values_list(
+                'book_id', 'quantity', 'price'):
+            items[book_id] = quantity
+            if price is not None:
+                prices[book_id] = price
+        return items, prices
+
+    def items(self):
+        if self._items is None:
+            self._items, self._prices = self._load()
+        return self._items
+
+    def prices(self):
+        if self._prices is None:
+            self._items, self._prices = self._load()
+        return self._prices
+
+    def _ensure_owner(self):
+        if self.owner is None:
+            self._token = secrets.token_hex(16)
+            self.owner = f'anon:{self._token}'
+
+    def _changed(self):
+        self._items = self._prices = None
+        self._modified = True
+
+    def add(self, book_id, quantity=1, price=None):
+        self._ensure_owner()
+        rows = CartItem.objects.filter(owner=self.owner, book_id=book_id)
+        # update() не заполняет auto_now, а по updated_at purge_carts
+        # находит заброшенные корзины
+        changes = {'quantity': F('quantity') + quantity,
+                   'updated_at': timezone.now()}
+        if price is not None:
+            changes['price'] = price
+        with transaction.atomic():
+            if quantity < 0:
+                # Строка, количество в которой ушло бы в ноль, удаляется
+                rows.filter(quantity__lte=-quantity).delete()
+                rows.update(**changes)
+            elif not rows.update(**changes):
+                try:
+                    with transaction.atomic():
+                        CartItem.objects.create(owner=self.owner,
+                                                book_id=book_id,
+                                                quantity=quantity,
+                                                price=price)
+                except IntegrityError:
+                    # Строку только что создал параллельный запрос
+                    rows.update(**changes)
+        self._changed()
+
+    def add_many(self, quantities, prices=None):
+        """Одна транзакция: существующие строки читаются одним запросом
+        с блокировкой и обновляются bulk_update, новые — bulk_create."""
+        self._ensure_owner()
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    self._add_many(quantities, prices or {})
+                break
+            except IntegrityError:
+                # Параллельный запрос создал одну из строк, повторяем
+                if attempt:
+                    raise
+        self._changed()
+
+    def _add_many(self, quantities, prices):
+        existing = {item.book_id: item for item in
+                    CartItem.objects.select_for_update().filter(
+                        owner=self.owner, book_id__in=list(quantities))}
+        now = timezone.now()
+        for book_id, item in existing.items():
+            item.quantity += quantities[book_id]
+            item.price = prices.get(book_id, item.price)
+            item.updated_at = now
+        CartItem.objects.bulk_update(existing.values(),
+                                     ['quantity', 'price', 'updated_at'])
+        CartItem.objects.bulk_create([
+            CartItem(owner=self.owner, book_id=book_id, quantity=quantity,
+                     price=prices.get(book_id))
+            for book_id, quantity in quantities.items()
+            if book_id not in existing])
+
+    def set(self, book_id, quantity):
+        self._ensure_owner()
+        if quantity > 0:
+            CartItem.objects.update_or_create(
+                owner=self.owner, book_id=book_id,
+                defaults={'quantity': quantity})
+        else:
+            CartItem.objects.filter(owner=self.owner,
+                                    book_id=book_id).delete()
+        self._changed()
+
+    def remember_prices(self, prices):
+        snapshots = self.prices()
+        changed = {book_id: price for book_id, price in prices.items()
+                   if book_id in self.items() and
+                   snapshots.get(book_id) != price}
+        if not changed:
+            return
+        now = timezone.now()
+        with transaction.atomic():
+            # Цены меняются редко, поэтому строк обычно одна-две
+            for book_id, price in changed.items():
+                CartItem.objects.filter(owner=self.owner, book_id=book_id) \
+                    .update(price=price, updated_at=now)
+        self._changed()
+
+    def clear(self):
+        if self.owner is not None:
+            CartItem.objects.filter(owner=self.owner).delete()
+            self._changed()
+
+    def save(self, response):
+        # Cookie гостя переустанавливается при каждом изменении корзины,
+        # чтобы её срок, как и срок строк в purge_carts, отсчитывался от
+        # последнего изменения
+        if self._token and self._modified:
+            response.set_cookie(CART_TOKEN_COOKIE, self._token,
+                                max_age=CART_COOKIE_MAX_AGE, httponly=True,
+                                samesite='Lax')
+
+
+class CookieCartStore(BaseCartStore):
+    def __init__(self, request):
+        super().__init__(request)
+        self.cookie_name = get_cart_cookie_name(request)
+        self._items, self._prices = decode_cart_cookie(
+            request.COOKIES.get(self.cookie_name, ''))
+        self._value = None
+
+    def items(self):
+        return self._items
+
+    def prices(self):
+        return self._prices
+
+    def _update(self, items, prices=None):
+        prices = {book_id: price
+                  for book_id, price in (prices or self._prices).items()
+                  if book_id in items}
+        value = encode_cart_cookie(items, prices)
+        if len(value) > COOKIE_SIZE_LIMIT:
+            raise CartTooLarge()
+        self._items = items
+        self._prices = prices
+        self._value = value
+
+    def add(self, book_id, quantity=1, price=None):
+        self.add_many({book_id: quantity},
+                      None if price is None else {book_id: price})
+
+    def add_many(self, quantities, prices=None):
+        items = dict(self._items)
+        for book_id, quantity in quantities.items():
+            items[book_id] = items.get(book_id, 0) + quantity
+            if items[book_id] <= 0:
+                del items[book_id]
+        self._update(items, {**self._prices, **(prices or {})})
+
+    def set(self, book_id, quantity):
+        items = dict(self._items)
+        if quantity > 0:
+            items[book_id] = quantity
+        else:
+            items.pop(book_id, None)
+        self._update(items)
+
+    def remember_prices(self, prices):
+        if any(self._prices.get(book_id) != price
+               for book_id, price in prices.items()
+               if book_id in self._items):
+            self._update(self._items, {**self._prices, **prices})
+
+    def clear(self):
+        self._update({})
+
+    def save(self, response):
+        if self._value is None:
+            return
+        if self._items:
+            response.set_cookie(self.cookie_name, self._value,
+                                max_age=CART_COOKIE_MAX_AGE)
+        else:
+            response.delete_cookie(self.cookie_name)
+
+
+def purge_anonymous_carts(days):
+    """Удаляет корзины гостей, не менявшиеся days дней. Cookie cart_token
+    живёт CART_COOKIE_MAX_AGE с последнего изменения корзины, так что при
+    days не меньше этого срока удаляются только корзины, до которых уже
+    никто не доберётся. Возвращает число удалённых строк."""
+    cutoff = timezone.now() - timedelta(days=days)
+    stale_owners = CartItem.objects.filter(owner__startswith='anon:') \
+        .values('owner').annotate(last_update=Max('updated_at')) \
+        .filter(last_update__lt=cutoff).values('owner')
+    deleted, _ = CartItem.objects.filter(owner__in=stale_owners).delete()
+    return deleted
+
+
+def get_cart(request):
+    """Возвращает хранилище корзины для запроса (одно на запрос)."""
+    if not hasattr(request, '_cart'):
+        request._cart = import_string(settings.BOOK_CART_BACKEND)(request)
+    return request._cart
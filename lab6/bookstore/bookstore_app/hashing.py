@@ -0,0 +1,223 @@
+"""
+Пул процессов для хэширования паролей.
+
+Хэширование пароля (вход, регистрация, смена пароля) занимает десятки
+миллисекунд процессора. Если выполнять его в потоке, обрабатывающем запрос,
+серия входов занимает GIL и все потоки рабочего процесса, и запросы
+каталога в том же процессе ждут. Поэтому хэшеры из hashers.py передают
+вычисление в ограниченный пул из BOOK_HASHING_WORKERS процессов, а поток
+запроса только ждёт результат.
+
+Очередь пула ограничена: если хэшей уже ожидает больше
+BOOK_HASHING_MAX_QUEUE, новое вычисление не ставится в очередь, а сразу
+завершается исключением HashingBusy, которое HashingBusyMiddleware
+превращает в ответ 503 с Retry-After. Так всплеск входов получает быстрый
+отказ вместо таймаута.
+
+Для ASGI-views есть arun_hash(): она ждёт результат, не блокируя цикл
+событий. Время хэширования, ожидания в очереди и проверки пароля при входе
+копится в счётчиках (см. caching.incr_counter) и видно командой
+hashing_stats.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .caching import get_counters, incr_counter, reset_counters
+
+# Верхние границы интервалов гистограмм времени, в миллисекундах
+LATENCY_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+# hash — вычисление в пуле, wait — ожидание в очереди пула, auth — проверка
+# логина и пароля при входе целиком (см. views.login_view)
+METRICS = ('hash', 'wait', 'auth')
+
+
+class HashingBusy(Exception):
+    """Очередь пула хэширования заполнена."""
+
+
+def stats_key(name):
+    return f'bookstore:hashing:{name}'
+
+
+def record_latency(metric, seconds):
+    incr_counter(stats_key(f'{metric}:count'))
+    incr_counter(stats_key(f'{metric}:total_us'), int(seconds * 1e6))
+    milliseconds = seconds * 1000
+    bucket = next((bound for bound in LATENCY_BUCKETS
+                   if milliseconds <= bound), 'inf')
+    incr_counter(stats_key(f'{metric}:le_{bucket}'))
+
+
+def get_percentile(values, metric, count, fraction):
+    """Верхняя граница интервала гистограммы, в который попадает
+    доля fraction вычислений."""
+    seen = 0
+    for bound in LATENCY_BUCKETS + ('inf',):
+        seen += values[stats_key(f'{metric}:le_{bound}')]
+        if seen >= count * fraction:
+            return bound
+    return 'inf'
+
+
+def get_stats_keys():
+    keys = [stats_key('rejected')]
+    for metric in METRICS:
+        keys += [stats_key(f'{metric}:count'),
+                 stats_key(f'{metric}:total_us')]
+        keys += [stats_key(f'{metric}:le_{bound}')
+                 for bound in LATENCY_BUCKETS + ('inf',)]
+    return keys
+
+
+def get_stats():
+    values = get_counters(get_stats_keys())
+    stats = {'rejected': values[stats_key('rejected')]}
+    for metric in METRICS:
+        count = values[stats_key(f'{metric}:count')]
+        total = values[stats_key(f'{metric}:total_us')]
+        stats[metric] = {
+            'count': count,
+            'avg_ms': total / count / 1000 if count else 0,
+            'p50_ms': get_percentile(values, metric, count, 0.5)
+            if count else 0,
+            'p99_ms': get_percentile(values, metric, count, 0.99)
+            if count else 0,
+        }
+    return stats
+
+
+def reset_stats():
+    reset_counters(get_stats_keys())
+
+
+def _timed(func, *args):
+    # Выполняется в процессе пула: время считается там же, чтобы не
+    # сравнивать часы разных процессов
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+class HashingExecutor:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pending = 0
+
+    def _get_pool(self):
+        if self._pool is None:
+            # spawn, а не fork: рабочий процесс веб-сервера многопоточный,
+            # и fork мог бы скопировать захваченные другими потоками
+            # блокировки. Запущенный заново процесс импортирует этот модуль,
+            # а с ним и модели, поэтому сначала настраивает Django.
+            self._pool = ProcessPoolExecutor(
+                settings.BOOK_HASHING_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup)
+        return self._pool
+
+    def submit(self, func, *args):
+        """Ставит func(*args) в очередь пула и возвращает Future с кортежем
+        (результат, время вычисления, время ожидания в очереди или None,
+        если пула нет). Если очередь заполнена, сразу поднимает
+        HashingBusy. Время учитывает вызывающий (см. run_hash), а не
+        callback пула: тот выполняется в служебном потоке пула, и запись
+        счётчиков открыла бы там соединение с БД, которое никто не
+        закроет."""
+        future = Future()
+        if not settings.BOOK_HASHING_WORKERS:
+            result, elapsed = _timed(func, *args)
+            future.set_result((result, elapsed, None))
+            return future
+
+        limit = settings.BOOK_HASHING_WORKERS + \
+            settings.BOOK_HASHING_MAX_QUEUE
+        with self._lock:
+            if self._pending >= limit:
+                incr_counter(stats_key('rejected'))
+                raise HashingBusy(f'В очереди хэширования {self._pending} '
+                                  f'вычислений')
+            self._pending += 1
+            pool = self._get_pool()
+        submitted = time.perf_counter()
+
+        def done(inner):
+            with self._lock:
+                self._pending -= 1
+            try:
+                result, elapsed = inner.result()
+            except BrokenProcessPool as exc:
+                # Процесс пула упал: следующий вызов создаст новый пул
+                with self._lock:
+                    if self._pool is pool:
+                        self._pool = None
+                future.set_exception(exc)
+            except BaseException as exc:
+                future.set_exception(exc)
+            else:
+                waited = time.perf_counter() - submitted - elapsed
+                future.set_result((result, elapsed, waited))
+
+        try:
+            inner = pool.submit(_timed, func, *args)
+        except BrokenProcessPool:
+            with self._lock:
+                self._pending -= 1
+                if self._pool is pool:
+                    self._pool = None
+            raise
+        inner.add_done_callback(done)
+        return future
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+
+executor = HashingExecutor()
+
+
+def _record(outcome):
+    result, elapsed, waited = outcome
+    record_latency('hash', elapsed)
+    if waited is not None:
+        record_latency('wait', waited)
+    return result
+
+
+def run_hash(func, *args):
+    """Вычисляет func(*args) в пуле и ждёт результат в текущем потоке."""
+    return _record(executor.submit(func, *args).result())
+
+
+async def arun_hash(func, *args):
+    """То же, что run_hash, для async-кода: цикл событий не блокируется."""
+    outcome = await asyncio.wrap_future(executor.submit(func, *args))
+    # Счётчики пишутся в БД, поэтому не в цикле событий
+    return await sync_to_async(_record)(outcome)
+
+
+def digest_rounds(digest, password, salt, iterations):
+    """Первая версия кастомного хэшера: хэш digest от пароля с солью,
+    повторённый iterations раз."""
+    constructor = getattr(hashlib, digest)
+    value = (password + salt).encode('utf-8')
+    for _ in range(iterations):
+        value = constructor(value).digest()
+    return value
+
+
+def pbkdf2(digest, password, salt, iterations):
+    return hashlib.pbkdf2_hmac(digest, password.encode('utf-8'),
+                               salt.encode('utf-8'), iterations)
@@ -0,0 +1,144 @@
+"""
+Ключи идемпотентности для оформления заказа и действий с корзиной.
+
+Клиент передаёт ключ в заголовке Idempotency-Key или в параметре
+idempotency_key (поле формы или строка запроса ссылки). Первый запрос
+с ключом выполняется, и его ответ сохраняется в таблице idempotency_record
+на BOOK_IDEMPOTENCY_TTL секунд; повтор (двойной клик, повторная отправка
+клиентом после обрыва связи) получает сохранённый ответ, а работа не
+выполняется второй раз. Пока первый запрос выполняется, ключ занят
+отметкой: повтор ждёт его результат до BOOK_IDEMPOTENCY_WAIT секунд
+и, не дождавшись, получает 409. Отметка живёт
+BOOK_IDEMPOTENCY_LOCK_TIMEOUT секунд, чуть дольше таймаута запроса: если
+рабочий процесс погиб посреди запроса, ключ освободится, и повтор выполнит
+работу сам.
+
+Записи хранятся в отдельной таблице, а не в кэше: кэш вытесняет записи
+раньше срока, когда их становится больше MAX_ENTRIES, и повтор выполнился
+бы заново. Срок записи задан явно в expires_at; просроченная запись
+занимается заново первым же запросом с тем же ключом, а остальные удаляет
+команда purge_idempotency_keys.
+
+Ключ действует в пределах покупателя и пути запроса. Запросы без ключа
+обрабатываются как обычно.
+"""
+import hashlib
+import pickle
+import time
+import uuid
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .carts import CART_TOKEN_COOKIE
+from .models import IdempotencyRecord
+
+POLL_INTERVAL = 0.05
+MAX_KEY_LENGTH = 255
+
+
+def new_idempotency_key():
+    """Ключ для формы или ссылки, которую отдаёт сервер."""
+    return uuid.uuid4().hex
+
+
+def get_idempotency_key(request):
+    key = request.headers.get('Idempotency-Key') or \
+        request.GET.get('idempotency_key')
+    if not key and request.method == 'POST':
+        key = request.POST.get('idempotency_key')
+    if key and len(key) <= MAX_KEY_LENGTH:
+        return key
+    return None
+
+
+def get_idempotency_scope(request):
+    """Кому принадлежит ключ: пользователю, гостю с корзиной на сервере
+    или, если ни того ни другого нет, адресу клиента."""
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    token = request.COOKIES.get(CART_TOKEN_COOKIE)
+    if token:
+        return f'anon:{token}'
+    return f'ip:{request.META.get("REMOTE_ADDR", "")}'
+
+
+def make_idempotency_record_key(request, key):
+    raw = '\0'.join([get_idempotency_scope(request), request.path, key])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def acquire_idempotency_key(record_key):
+    """Пытается занять ключ отметкой «выполняется». Возвращает (True, None),
+    если отметку поставил этот запрос, иначе (False, запись ключа или None,
+    если её только что удалили)."""
+    now = timezone.now()
+    locked_until = now + timedelta(
+        seconds=settings.BOOK_IDEMPOTENCY_LOCK_TIMEOUT)
+    # Просроченную запись (ответ старше TTL или отметку погибшего процесса)
+    # условный UPDATE отдаёт только одному запросу
+    if IdempotencyRecord.objects.filter(key=record_key, expires_at__lte=now) \
+            .update(response=None, expires_at=locked_until):
+        return True, None
+    try:
+        with transaction.atomic():
+            IdempotencyRecord.objects.create(key=record_key,
+                                             expires_at=locked_until)
+    except IntegrityError:
+        return False, IdempotencyRecord.objects.filter(key=record_key) \
+            .first()
+    return True, None
+
+
+def purge_idempotency_records():
+    """Удаляет просроченные записи и возвращает их число."""
+    deleted, _ = IdempotencyRecord.objects.filter(
+        expires_at__lt=timezone.now()).delete()
+    return deleted
+
+
+def idempotent(view):
+    """Декоратор view: повтор запроса с тем же ключом получает ответ
+    первого запроса. Ответы с кодом 5xx не сохраняются, чтобы повтор мог
+    выполнить работу заново."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = get_idempotency_key(request)
+        if key is None:
+            return view(request, *args, **kwargs)
+        record_key = make_idempotency_record_key(request, key)
+        deadline = time.monotonic() + settings.BOOK_IDEMPOTENCY_WAIT
+        while True:
+            acquired, record = acquire_idempotency_key(record_key)
+            if acquired:
+                break
+            if record is not None and record.response is not None:
+                stored = pickle.loads(record.response)
+                stored['Idempotent-Replayed'] = 'true'
+                return stored
+            if time.monotonic() > deadline:
+                return JsonResponse({'error': 'Запрос с этим ключом ещё '
+                                              'выполняется.'}, status=409)
+            time.sleep(POLL_INTERVAL)
+
+        # Отметка этого запроса: записи без ответа
+        marker = IdempotencyRecord.objects.filter(key=record_key,
+                                                  response=None)
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            marker.delete()
+            raise
+        if response.status_code >= 500 or response.streaming:
+            marker.delete()
+        else:
+            marker.update(
+                response=pickle.dumps(response, pickle.HIGHEST_PROTOCOL),
+                expires_at=timezone.now() + timedelta(
+                    seconds=settings.BOOK_IDEMPOTENCY_TTL))
+        return response
+    return wrapper
@@ -0,0 +1,123 @@
+"""
+Очередь фоновых задач в БД.
+
+Задача — строка таблицы job с именем обработчика и JSON-параметрами.
+enqueue() вызывается внутри транзакции запроса, поэтому задача появляется
+в очереди ровно тогда, когда зафиксированы данные, к которым она относится,
+и внешний брокер не нужен. Команда run_jobs забирает готовые задачи и
+выполняет их в пуле потоков.
+
+В PostgreSQL задачи захватываются SELECT ... FOR UPDATE SKIP LOCKED, так
+что несколько обработчиков не ждут друг друга. SQLite не поддерживает
+FOR UPDATE, но выполняет записи по одной, поэтому там задача захватывается
+условным UPDATE ... WHERE status = 'pending': его применит только один
+обработчик.
+
+Обработчики регистрируются декоратором @task (см. tasks.py). Упавшая задача
+повторяется с экспоненциальной задержкой до BOOK_JOB_MAX_ATTEMPTS раз.
+"""
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+# Имя задачи -> функция, принимающая параметры задачи
+HANDLERS = {}
+
+# Задержка перед повтором: RETRY_DELAY * 2 ** (попытка - 1) секунд
+RETRY_DELAY = 10
+
+
+def task(name):
+    """Регистрирует функцию как обработчик задач с именем name."""
+    def register(func):
+        HANDLERS[name] = func
+        return func
+    return register
+
+
+def enqueue(name, payload=None, delay=0):
+    """Ставит задачу в очередь. Внутри transaction.atomic() задача станет
+    видна обработчикам только после фиксации транзакции."""
+    return Job.objects.create(
+        name=name, payload=payload or {},
+        run_after=timezone.now() + timedelta(seconds=delay))
+
+
+def claim_jobs(limit, worker):
+    """Захватывает до limit готовых задач и помечает их выполняемыми."""
+    now = timezone.now()
+    ready = Job.objects.filter(status=Job.PENDING, run_after__lte=now) \
+        .order_by('run_after', 'id')
+    claim = {'status': Job.RUNNING, 'locked_at': now, 'locked_by': worker,
+             'attempts': F('attempts') + 1}
+    connection = connections[router.db_for_write(Job)]
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            jobs = list(ready.select_for_update(skip_locked=True)[:limit])
+            Job.objects.filter(pk__in=[job.pk for job in jobs]) \
+                .update(**claim)
+    else:
+        jobs = [job for job in ready[:limit]
+                if Job.objects.filter(pk=job.pk, status=Job.PENDING)
+                .update(**claim)]
+    for job in jobs:
+        job.status, job.locked_at, job.locked_by = Job.RUNNING, now, worker
+        job.attempts += 1
+    return jobs
+
+
+def run_job(job):
+    """Выполняет захваченную задачу и записывает результат."""
+    try:
+        handler = HANDLERS.get(job.name)
+        if handler is None:
+            raise LookupError(f'Нет обработчика задачи {job.name!r}')
+        handler(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts < settings.BOOK_JOB_MAX_ATTEMPTS:
+            job.status = Job.PENDING
+            job.run_after = timezone.now() + timedelta(
+                seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+        else:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+    else:
+        job.status = Job.DONE
+        job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'run_after', 'last_error',
+                            'finished_at'])
+    return job.status
+
+
+def requeue_stale_jobs(timeout):
+    """Возвращает в очередь задачи, которые выполняются дольше timeout
+    секунд: их обработчик, скорее всего, завершился аварийно. Задача,
+    исчерпавшая BOOK_JOB_MAX_ATTEMPTS попыток, помечается упавшей, чтобы
+    задача, роняющая обработчик, не повторялась бесконечно. Возвращает
+    пару (возвращено в очередь, помечено упавшими)."""
+    now = timezone.now()
+    stale = Job.objects.filter(
+        status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=timeout))
+    failed = stale.filter(
+        attempts__gte=settings.BOOK_JOB_MAX_ATTEMPTS,
+    ).update(status=Job.FAILED, finished_at=now, locked_at=None,
+             locked_by='',
+             last_error=f'Обработчик не завершил задачу за {timeout} с')
+    requeued = stale.update(status=Job.PENDING, locked_at=None, locked_by='')
+    return requeued, failed
+
+
+def purge_jobs(days):
+    """Удаляет выполненные задачи старше days дней."""
+    deleted, _ = Job.objects.filter(
+        status=Job.DONE,
+        finished_at__lt=timezone.now() - timedelta(days=days),
+    ).delete()
+    return deleted
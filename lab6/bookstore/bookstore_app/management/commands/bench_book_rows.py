@@ -0,0 +1,63 @@
+import timeit
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.template import Context, Template
+
+from bookstore_app.renderers import BookRowRenderer
+
+# Цикл строк в том виде, в каком он был в book_list_fragment.html
+TEMPLATE_ROWS = Template("""{% for book in page_obj %}
+                <tr>
+                    <td>{{ book.title }}</td>
+                    <td>{{ book.author }}</td>
+                    <td>{{ book.publisher }}</td>
+                    <td>{{ book.cost }}</td>
+                    <td><a href="{% url 'add_to_cart' book.pk %}" class="add-to-cart">В корзину</a></td>
+                    {% if request.user.is_staff %}
+                        <td>
+                            <a href="{% url 'edit_book' book.pk %}">Редактировать</a>
+                            <a href="{% url 'delete_book' book.pk %}" onclick="return confirm('Вы уверены?')">Удалить</a>
+                        </td>
+                    {% endif %}
+                </tr>
+            {% endfor %}""")
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает рендеринг строк таблицы книг шаблоном Django ' \
+           'и BookRowRenderer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,1000',
+                            help='Число строк через запятую.')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Число повторов, берётся лучший.')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        self.stdout.write(f"{'rows':>6} {'staff':>6} {'template, ms':>13} "
+                          f"{'renderer, ms':>13} {'speedup':>8}")
+        for size in sizes:
+            rows = [(pk, f'Книга <{pk}>', f'Автор {pk}',
+                     None if pk % 3 else f'Издатель {pk}', 100.0 + pk)
+                    for pk in range(1, size + 1)]
+            books = [SimpleNamespace(pk=pk, title=title, author=author,
+                                     publisher=publisher, cost=cost)
+                     for pk, title, author, publisher, cost in rows]
+            for is_staff in (False, True):
+                request = SimpleNamespace(
+                    user=SimpleNamespace(is_staff=is_staff))
+                context = Context({'page_obj': books, 'request': request})
+                number = max(1, 1000 // size)
+                template_time = min(timeit.repeat(
+                    lambda: TEMPLATE_ROWS.render(context),
+                    number=number, repeat=options['repeat'])) / number
+                renderer_time = min(timeit.repeat(
+                    lambda: BookRowRenderer(is_staff).render(rows),
+                    number=number, repeat=options['repeat'])) / number
+                self.stdout.write(
+                    f'{size:>6} {str(is_staff):>6} '
+                    f'{template_time * 1000:>13.3f} '
+                    f'{renderer_time * 1000:>13.3f} '
+                    f'{template_time / renderer_time:>7.1f}x')
@@ -0,0 +1,46 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from bookstore_app.caching import discard_counters
+from bookstore_app.hashers import CustomSHA256PasswordHasher, \
+    CustomSHA256V2PasswordHasher
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает время проверки пароля первой и второй версией ' \
+           'кастомного хэшера SHA256. Хэширование выполняется в этом ' \
+           'процессе, без пула из hashing.py, и не попадает в ' \
+           'hashing_stats.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', default=None,
+                            help='Числа итераций через запятую; по '
+                                 'умолчанию — текущие значения хэшеров.')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Число повторов, берётся лучший.')
+
+    def handle(self, *args, **options):
+        with override_settings(BOOK_HASHING_WORKERS=0), discard_counters():
+            self.bench(options)
+
+    def bench(self, options):
+        v1, v2 = CustomSHA256PasswordHasher(), CustomSHA256V2PasswordHasher()
+        if options['iterations']:
+            sizes = [int(size) for size in options['iterations'].split(',')]
+        else:
+            sizes = sorted({v1.iterations, v2.iterations})
+        self.stdout.write(f"{'iterations':>10} {'v1, ms':>9} {'v2, ms':>9} "
+                          f"{'speedup':>8}")
+        for iterations in sizes:
+            times = []
+            for hasher in (v1, v2):
+                encoded = hasher.encode('password', hasher.salt(), iterations)
+                times.append(min(timeit.repeat(
+                    lambda: hasher.verify('password', encoded),
+                    number=1, repeat=options['repeat'])))
+            v1_time, v2_time = times
+            self.stdout.write(f'{iterations:>10} {v1_time * 1000:>9.1f} '
+                              f'{v2_time * 1000:>9.1f} '
+                              f'{v1_time / v2_time:>7.1f}x')
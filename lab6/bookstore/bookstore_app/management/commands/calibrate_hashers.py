@@ -0,0 +1,154 @@
+import json
+import math
+import os
+import platform
+import socket
+import time
+
+import django
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from bookstore_app.caching import discard_counters
+
+# Параметр, задающий трудоёмкость хэшера, и как от него зависит время:
+# linear — пропорционально значению, log2 — удваивается с каждой единицей
+WORK_FACTORS = (
+    ('iterations', 'linear'),
+    ('time_cost', 'linear'),
+    ('rounds', 'log2'),
+)
+# Минимальные значения параметров, которые принимают библиотеки
+MIN_WORK_FACTORS = {'iterations': 1000, 'time_cost': 1, 'rounds': 4}
+
+
+def get_work_factor(hasher):
+    for name, scale in WORK_FACTORS:
+        if hasattr(hasher, name):
+            return name, scale, getattr(hasher, name)
+    return None, None, None
+
+
+def percentile(samples, fraction):
+    """Процентиль по ближайшему рангу; samples отсортированы."""
+    rank = max(1, math.ceil(fraction * len(samples)))
+    return samples[rank - 1]
+
+
+def suggest_work_factor(name, scale, value, median, target):
+    """Наибольшее значение параметра, при котором медиана проверки пароля,
+    пересчитанная из измеренной, укладывается в target."""
+    if scale == 'log2':
+        suggested = value + math.floor(math.log2(target / median))
+    else:
+        suggested = math.floor(value * target / median)
+        if name == 'iterations':
+            suggested -= suggested % 1000
+    return max(suggested, MIN_WORK_FACTORS[name])
+
+
+class Command(BaseCommand):
+    help = 'Измеряет время проверки пароля каждым хэшером из ' \
+           'PASSWORD_HASHERS на этой машине, выводит p50/p99 и число ' \
+           'входов в секунду на ядро и предлагает параметр трудоёмкости ' \
+           'для целевого времени. Хэширование выполняется в этом процессе, ' \
+           'без пула из hashing.py, чтобы мерить стоимость на одном ядре. ' \
+           'Предложение — оценка по линейной (для bcrypt — ' \
+           'логарифмической) зависимости; у Argon2 меняется только ' \
+           'time_cost.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=20,
+                            help='Число проверок пароля на хэшер.')
+        parser.add_argument('--target-ms', type=float, default=100.0,
+                            help='Целевое время проверки пароля (p50), мс.')
+        parser.add_argument('--algorithms', default=None,
+                            help='Алгоритмы через запятую; по умолчанию — '
+                                 'все из PASSWORD_HASHERS.')
+        parser.add_argument('--json', dest='json_path', default=None,
+                            help='Записать отчёт в JSON-файл '
+                                 '(«-» — в stdout вместо таблицы).')
+
+    def handle(self, *args, **options):
+        algorithms = None
+        if options['algorithms']:
+            algorithms = set(options['algorithms'].split(','))
+        # Без пула, и замеры не попадают в счётчики hashing_stats
+        with override_settings(BOOK_HASHING_WORKERS=0), discard_counters():
+            results = [self.measure(hasher, options)
+                       for hasher in get_hashers()
+                       if algorithms is None or
+                       hasher.algorithm in algorithms]
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'host': socket.gethostname(),
+            'cpu_count': os.cpu_count(),
+            'machine': platform.machine(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'samples': options['samples'],
+            'target_ms': options['target_ms'],
+            'hashers': results,
+        }
+        if options['json_path'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.write_table(results)
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(f"Отчёт записан в {options['json_path']}")
+
+    def measure(self, hasher, options):
+        cls = type(hasher)
+        name, scale, value = get_work_factor(hasher)
+        result = {
+            'hasher': f'{cls.__module__}.{cls.__qualname__}',
+            'algorithm': hasher.algorithm,
+            'work_factor': name,
+            'work_factor_value': value,
+        }
+        try:
+            encoded = hasher.encode('password', hasher.salt())
+        except ValueError as exc:
+            # Нет библиотеки (argon2-cffi, bcrypt)
+            result['error'] = str(exc)
+            return result
+
+        samples = []
+        for _ in range(options['samples']):
+            started = time.perf_counter()
+            hasher.verify('password', encoded)
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        median = percentile(samples, 0.5)
+        mean = sum(samples) / len(samples)
+        result.update({
+            'p50_ms': round(median, 3),
+            'p99_ms': round(percentile(samples, 0.99), 3),
+            'mean_ms': round(mean, 3),
+            'logins_per_sec_per_core': round(1000 / mean, 1),
+            'suggested_work_factor': suggest_work_factor(
+                name, scale, value, median, options['target_ms'])
+            if name else None,
+        })
+        return result
+
+    def write_table(self, results):
+        self.stdout.write(f"{'algorithm':<24} {'factor':>18} {'p50, ms':>9} "
+                          f"{'p99, ms':>9} {'logins/s':>9} {'suggested':>10}")
+        for result in results:
+            factor = f"{result['work_factor']}={result['work_factor_value']}" \
+                if result['work_factor'] else '-'
+            if 'error' in result:
+                self.stdout.write(f"{result['algorithm']:<24} {factor:>18} "
+                                  f"  недоступен: {result['error']}")
+                continue
+            suggested = result['suggested_work_factor']
+            self.stdout.write(
+                f"{result['algorithm']:<24} {factor:>18} "
+                f"{result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                f"{result['logins_per_sec_per_core']:>9.1f} "
+                f"{'-' if suggested is None else suggested:>10}")
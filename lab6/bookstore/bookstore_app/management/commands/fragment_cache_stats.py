@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from bookstore_app.caching import get_fragment_cache_stats, \
+    reset_fragment_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает счётчики попаданий и промахов кэша фрагментов ' \
+           'списка книг.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить счётчики после вывода.')
+
+    def handle(self, *args, **options):
+        stats = get_fragment_cache_stats()
+        self.stdout.write(
+            f"hits: {stats['hits']}\n"
+            f"misses: {stats['misses']}\n"
+            f"hit ratio: {stats['hit_ratio']:.2%}")
+        if options['reset']:
+            reset_fragment_cache_stats()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from bookstore_app.hashing import METRICS, get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает время хэширования паролей в пуле процессов, время ' \
+           'ожидания в очереди, время проверки пароля при входе и число ' \
+           'отказов из-за заполненной очереди.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить счётчики после вывода.')
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        for metric in METRICS:
+            values = stats[metric]
+            self.stdout.write(
+                f"{metric}: count {values['count']}, "
+                f"avg {values['avg_ms']:.1f} ms, "
+                f"p50 <= {values['p50_ms']} ms, "
+                f"p99 <= {values['p99_ms']} ms")
+        self.stdout.write(f"rejected: {stats['rejected']}")
+        if options['reset']:
+            reset_stats()
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from bookstore_app.carts import CART_COOKIE_MAX_AGE, purge_anonymous_carts
+
+
+class Command(BaseCommand):
+    help = 'Удаляет из cart_item корзины гостей, которые не менялись ' \
+           'дольше срока жизни cookie cart_token. Запускайте по ' \
+           'расписанию, например раз в сутки.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            default=CART_COOKIE_MAX_AGE // (24 * 60 * 60),
+                            help='Удалять корзины, не менявшиеся столько '
+                                 'дней (по умолчанию — срок жизни cookie).')
+
+    def handle(self, *args, **options):
+        deleted = purge_anonymous_carts(options['days'])
+        self.stdout.write(f'Удалено строк корзин: {deleted}')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from bookstore_app.idempotency import purge_idempotency_records
+
+
+class Command(BaseCommand):
+    help = 'Удаляет из idempotency_record просроченные ответы и отметки ' \
+           'запросов с ключом идемпотентности. Запускайте по расписанию, ' \
+           'например раз в сутки.'
+
+    def handle(self, *args, **options):
+        deleted = purge_idempotency_records()
+        self.stdout.write(f'Удалено ключей идемпотентности: {deleted}')
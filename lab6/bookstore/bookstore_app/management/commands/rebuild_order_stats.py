@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from bookstore_app.models import OrderStats
+from bookstore_app.orders import compute_order_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сводки заказов пользователей (OrderStats) по ' \
+           'таблицам заказов или проверяет, что они совпадают.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Только сравнить сводки с заказами, '
+                                 'ничего не меняя. При расхождениях '
+                                 'команда завершается с ошибкой.')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            self.verify()
+        else:
+            self.rebuild()
+
+    def rebuild(self):
+        with transaction.atomic():
+            expected = compute_order_stats()
+            OrderStats.objects.all().delete()
+            OrderStats.objects.bulk_create([
+                OrderStats(user_id=user_id, orders_count=orders_count,
+                           total_spent=total_spent,
+                           books_bought=books_bought)
+                for user_id, (orders_count, total_spent, books_bought)
+                in expected.items()])
+        self.stdout.write(f'Пересчитано сводок: {len(expected)}')
+
+    def verify(self):
+        expected = compute_order_stats()
+        actual = {stats.user_id: (stats.orders_count, stats.total_spent,
+                                  stats.books_bought)
+                  for stats in OrderStats.objects.all()}
+        zero = (0, 0, 0)
+        mismatches = 0
+        for user_id in sorted(expected.keys() | actual.keys()):
+            want = expected.get(user_id, zero)
+            have = actual.get(user_id, zero)
+            if want != have:
+                mismatches += 1
+                self.stdout.write(f'user {user_id}: в сводке {have}, '
+                                  f'по заказам {want}')
+        if mismatches:
+            raise CommandError(f'Расхождений: {mismatches}. Запустите '
+                               'rebuild_order_stats без --verify.')
+        self.stdout.write(f'Сводки совпадают с заказами '
+                          f'({len(expected)} пользователей).')
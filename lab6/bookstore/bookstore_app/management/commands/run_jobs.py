@@ -0,0 +1,87 @@
+import os
+import socket
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from bookstore_app.jobs import claim_jobs, purge_jobs, requeue_stale_jobs, \
+    run_job
+from bookstore_app.models import Job
+
+# Как часто (в секундах) возвращать зависшие задачи и чистить старые
+MAINTENANCE_INTERVAL = 60
+
+
+def run_in_thread(job):
+    try:
+        return run_job(job)
+    finally:
+        # Соединения с БД у каждого потока свои
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи из таблицы job в пуле потоков. ' \
+           'Можно запускать несколько экземпляров одновременно.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Число потоков.')
+        parser.add_argument('--batch', type=int, default=None,
+                            help='Сколько задач захватывать за раз '
+                                 '(по умолчанию — по две на поток).')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Пауза в секундах, когда очередь пуста.')
+        parser.add_argument('--once', action='store_true',
+                            help='Выполнить готовые задачи и завершиться.')
+        parser.add_argument('--purge-days', type=int, default=7,
+                            help='Удалять выполненные задачи старше N дней; '
+                                 '0 — не удалять.')
+
+    def handle(self, *args, **options):
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        batch = options['batch'] or options['workers'] * 2
+        maintained_at = None
+        totals = Counter()
+        with ThreadPoolExecutor(options['workers']) as pool:
+            try:
+                while True:
+                    now = time.monotonic()
+                    if maintained_at is None or \
+                            now - maintained_at > MAINTENANCE_INTERVAL:
+                        self.maintain(options['purge_days'])
+                        maintained_at = now
+                    jobs = claim_jobs(batch, worker)
+                    if jobs:
+                        statuses = Counter(pool.map(run_in_thread, jobs))
+                        totals.update(statuses)
+                        if options['verbosity'] >= 2:
+                            self.report(statuses)
+                    elif options['once']:
+                        break
+                    else:
+                        time.sleep(options['poll_interval'])
+            except KeyboardInterrupt:
+                pass
+        self.report(totals, 'Итого: ')
+
+    def maintain(self, purge_days):
+        requeued, failed = requeue_stale_jobs(
+            settings.BOOK_JOB_STALE_TIMEOUT)
+        if requeued:
+            self.stderr.write(f'Возвращено в очередь зависших задач: '
+                              f'{requeued}')
+        if failed:
+            self.stderr.write(f'Зависших задач без оставшихся попыток: '
+                              f'{failed}')
+        if purge_days:
+            purge_jobs(purge_days)
+
+    def report(self, statuses, prefix=''):
+        self.stdout.write(f"{prefix}выполнено {statuses[Job.DONE]}, "
+                          f"отложено {statuses[Job.PENDING]}, "
+                          f"с ошибкой {statuses[Job.FAILED]}")
@@ -0,0 +1,41 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bookstore_app.analytics import backfill_sales, compact_sales
+
+
+class Command(BaseCommand):
+    help = 'Обслуживает сводку продаж book_sales: пересчитывает её по ' \
+           'заказам и сворачивает старые дни в месяцы. Заказы, которые ' \
+           'покупатели убрали из истории, при пересчёте учитываются.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backfill', action='store_true',
+                            help='Пересчитать сводку по заказам.')
+        parser.add_argument('--since', default=None,
+                            help='Пересчитывать начиная с месяца этой даты '
+                                 '(ГГГГ-ММ-ДД); по умолчанию — всё.')
+        parser.add_argument('--compact', action='store_true',
+                            help='Свернуть дни старше '
+                                 'BOOK_SALES_COMPACT_DAYS в месячные строки.')
+        parser.add_argument('--compact-days', type=int, default=None,
+                            help='Другой порог для --compact, в днях.')
+
+    def handle(self, *args, **options):
+        if not options['backfill'] and not options['compact']:
+            raise CommandError('Укажите --backfill и/или --compact.')
+        if options['backfill']:
+            since = None
+            if options['since']:
+                try:
+                    since = date.fromisoformat(options['since'])
+                except ValueError:
+                    raise CommandError('--since ожидает дату ГГГГ-ММ-ДД.')
+            created = backfill_sales(since)
+            self.stdout.write(f'Записано дневных строк: {created}')
+        if options['compact']:
+            days = options['compact_days'] or settings.BOOK_SALES_COMPACT_DAYS
+            deleted = compact_sales(days)
+            self.stdout.write(f'Свёрнуто дневных строк: {deleted}')
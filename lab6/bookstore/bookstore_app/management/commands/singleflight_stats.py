@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from bookstore_app.singleflight import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает, сколько запросов каталога было объединено ' \
+           'с уже выполняющимися.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить счётчики после вывода.')
+
+    def handle(self, *args, **options):
+        stats = get_stats()
+        self.stdout.write(
+            f"coalesced: {stats['coalesced']}\n"
+            f"timeouts: {stats['timeouts']}")
+        if options['reset']:
+            reset_stats()
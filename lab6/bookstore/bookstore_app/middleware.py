@@ -0,0 +1,30 @@
+from django.http import HttpResponse, JsonResponse
+
+from .hashing import HashingBusy
+
+# Через сколько секунд клиенту стоит повторить запрос после 503
+HASHING_BUSY_RETRY_AFTER = 1
+
+
+class HashingBusyMiddleware:
+    """Отвечает 503 на запрос, которому не хватило места в очереди
+    хэширования паролей (см. hashing.py)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, HashingBusy):
+            return None
+        message = 'Сервер перегружен, повторите попытку через несколько ' \
+                  'секунд.'
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            response = JsonResponse({'error': message}, status=503)
+        else:
+            response = HttpResponse(message, status=503,
+                                    content_type='text/plain; charset=utf-8')
+        response['Retry-After'] = str(HASHING_BUSY_RETRY_AFTER)
+        return response
@@ -0,0 +1,74 @@
+from django.db import OperationalError, migrations, transaction
+
+# SQL зафиксирован здесь, а не импортируется из search.py: миграция должна
+# создавать ту схему, которая была на момент её написания
+
+INSTALL_SQL = {
+    'postgresql': [
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        "ALTER TABLE book ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('simple', coalesce(title, ''))) "
+        "STORED",
+        'CREATE INDEX IF NOT EXISTS book_search_vector_idx '
+        'ON book USING GIN (search_vector)',
+        'CREATE INDEX IF NOT EXISTS book_title_trgm_idx '
+        'ON book USING GIN (UPPER(title::text) gin_trgm_ops)',
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5("
+        "title, content='book', content_rowid='id', tokenize='trigram')",
+        'CREATE TRIGGER IF NOT EXISTS book_fts_ai AFTER INSERT ON book BEGIN '
+        'INSERT INTO book_fts(rowid, title) VALUES (new.id, new.title); END',
+        'CREATE TRIGGER IF NOT EXISTS book_fts_ad AFTER DELETE ON book BEGIN '
+        "INSERT INTO book_fts(book_fts, rowid, title) "
+        "VALUES ('delete', old.id, old.title); END",
+        'CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE ON book BEGIN '
+        "INSERT INTO book_fts(book_fts, rowid, title) "
+        "VALUES ('delete', old.id, old.title); "
+        'INSERT INTO book_fts(rowid, title) VALUES (new.id, new.title); END',
+        "INSERT INTO book_fts(book_fts) VALUES ('rebuild')",
+    ],
+}
+
+UNINSTALL_SQL = {
+    'postgresql': [
+        'DROP INDEX IF EXISTS book_title_trgm_idx',
+        'DROP INDEX IF EXISTS book_search_vector_idx',
+        'ALTER TABLE book DROP COLUMN IF EXISTS search_vector',
+    ],
+    'sqlite': [
+        'DROP TRIGGER IF EXISTS book_fts_au',
+        'DROP TRIGGER IF EXISTS book_fts_ad',
+        'DROP TRIGGER IF EXISTS book_fts_ai',
+        'DROP TABLE IF EXISTS book_fts',
+    ],
+}
+
+
+def install(apps, schema_editor):
+    connection = schema_editor.connection
+    try:
+        with transaction.atomic(using=connection.alias):
+            for statement in INSTALL_SQL.get(connection.vendor, []):
+                schema_editor.execute(statement)
+    except OperationalError:
+        # Триграммный токенизатор FTS5 есть только в SQLite 3.34+; без
+        # таблицы book_fts поиск идёт через icontains
+        if connection.vendor != 'sqlite':
+            raise
+
+
+def uninstall(apps, schema_editor):
+    for statement in UNINSTALL_SQL.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore_app', '0005_alter_book_options_alter_book_publisher'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,45 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+# SQL зафиксирован здесь, а не импортируется из search.py (см. 0006)
+SQLITE_TRIGGERS_SQL = [
+    'CREATE TRIGGER IF NOT EXISTS book_fts_ai AFTER INSERT ON book BEGIN '
+    'INSERT INTO book_fts(rowid, title) VALUES (new.id, new.title); END',
+    'CREATE TRIGGER IF NOT EXISTS book_fts_ad AFTER DELETE ON book BEGIN '
+    "INSERT INTO book_fts(book_fts, rowid, title) "
+    "VALUES ('delete', old.id, old.title); END",
+    'CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE ON book BEGIN '
+    "INSERT INTO book_fts(book_fts, rowid, title) "
+    "VALUES ('delete', old.id, old.title); "
+    'INSERT INTO book_fts(rowid, title) VALUES (new.id, new.title); END',
+]
+
+
+def reinstall_search_triggers(apps, schema_editor):
+    # SQLite пересоздаёт таблицу book при добавлении поля, а вместе с ней
+    # удаляются триггеры, синхронизирующие book_fts. Если book_fts нет
+    # (SQLite старше 3.34), триггеры не нужны
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or \
+            'book_fts' not in connection.introspection.table_names():
+        return
+    for statement in SQLITE_TRIGGERS_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore_app', '0007_book_title_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now, verbose_name='Изменено'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(reinstall_search_triggers,
+                             migrations.RunPython.noop),
+    ]
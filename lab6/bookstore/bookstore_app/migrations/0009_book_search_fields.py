@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:43
+
+from django.db import OperationalError, migrations, models, transaction
+
+# SQL зафиксирован здесь, а не импортируется из search.py (см. 0006).
+# book_fts получает колонки author и publisher, а PostgreSQL — триграммные
+# индексы по ним. Таблицу FTS5 нельзя изменить на месте, поэтому в SQLite
+# она удаляется и строится заново
+REBUILD_SQL = {
+    'postgresql': [
+        'CREATE INDEX IF NOT EXISTS book_author_trgm_idx '
+        'ON book USING GIN (UPPER(author::text) gin_trgm_ops)',
+        'CREATE INDEX IF NOT EXISTS book_publisher_trgm_idx '
+        'ON book USING GIN (UPPER(publisher::text) gin_trgm_ops)',
+    ],
+    'sqlite': [
+        'DROP TRIGGER IF EXISTS book_fts_au',
+        'DROP TRIGGER IF EXISTS book_fts_ad',
+        'DROP TRIGGER IF EXISTS book_fts_ai',
+        'DROP TABLE IF EXISTS book_fts',
+        "CREATE VIRTUAL TABLE book_fts USING fts5("
+        "title, author, publisher, content='book', content_rowid='id', "
+        "tokenize='trigram')",
+        'CREATE TRIGGER book_fts_ai AFTER INSERT ON book BEGIN '
+        'INSERT INTO book_fts(rowid, title, author, publisher) '
+        'VALUES (new.id, new.title, new.author, new.publisher); END',
+        'CREATE TRIGGER book_fts_ad AFTER DELETE ON book BEGIN '
+        "INSERT INTO book_fts(book_fts, rowid, title, author, publisher) "
+        "VALUES ('delete', old.id, old.title, old.author, old.publisher); "
+        "END",
+        'CREATE TRIGGER book_fts_au AFTER UPDATE ON book BEGIN '
+        "INSERT INTO book_fts(book_fts, rowid, title, author, publisher) "
+        "VALUES ('delete', old.id, old.title, old.author, old.publisher); "
+        'INSERT INTO book_fts(rowid, title, author, publisher) '
+        'VALUES (new.id, new.title, new.author, new.publisher); END',
+        "INSERT INTO book_fts(book_fts) VALUES ('rebuild')",
+    ],
+}
+
+
+def rebuild(apps, schema_editor):
+    connection = schema_editor.connection
+    try:
+        with transaction.atomic(using=connection.alias):
+            for statement in REBUILD_SQL.get(connection.vendor, []):
+                schema_editor.execute(statement)
+    except OperationalError:
+        # SQLite старше 3.34: без триграммного токенизатора book_fts не
+        # создаётся (см. 0006)
+        if connection.vendor != 'sqlite':
+            raise
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore_app', '0008_book_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['cost', 'id'], name='book_cost_id_idx'),
+        ),
+        migrations.RunPython(rebuild, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore_app', '0009_book_search_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(max_length=64, verbose_name='Владелец')),
+                ('quantity', models.PositiveIntegerField(default=1, verbose_name='Количество')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Изменено')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bookstore_app.book', verbose_name='Книга')),
+            ],
+            options={
+                'verbose_name': 'Строка корзины',
+                'verbose_name_plural': 'Строки корзины',
+                'db_table': 'cart_item',
+                'constraints': [models.UniqueConstraint(fields=('owner', 'book'), name='cart_item_owner_book_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore_app', '0010_cartitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Цена при добавлении'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore_app', '0011_cartitem_price'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Оформлен')),
+                ('total_cost', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Итоговая стоимость')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orders', to=settings.AUTH_USER_MODEL, verbose_name='Покупатель')),
+            ],
+            options={
+                'verbose_name': 'Заказ',
+                'verbose_name_plural': 'Заказы',
+                'db_table': 'book_order',
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='Название')),
+                ('author', models.CharField(max_length=200, verbose_name='Автор')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('cost', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена за единицу')),
+                ('book', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bookstore_app.book', verbose_name='Книга')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='bookstore_app.order', verbose_name='Заказ')),
+            ],
+            options={
+                'verbose_name': 'Строка заказа',
+                'verbose_name_plural': 'Строки заказа',
+                'db_table': 'order_item',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'created_at'], name='order_user_created_idx'),
+        ),
+    ]
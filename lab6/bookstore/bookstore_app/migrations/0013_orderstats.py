@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('bookstore_app', '0012_order'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='order_stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Покупатель')),
+                ('orders_count', models.PositiveIntegerField(default=0, verbose_name='Заказов')),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Потрачено')),
+                ('books_bought', models.PositiveIntegerField(default=0, verbose_name='Куплено книг')),
+            ],
+            options={
+                'verbose_name': 'Сводка заказов',
+                'verbose_name_plural': 'Сводки заказов',
+                'db_table': 'order_stats',
+            },
+        ),
+    ]
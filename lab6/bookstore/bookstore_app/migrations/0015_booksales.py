@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore_app', '0014_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'День'), ('month', 'Месяц')], default='day', max_length=5, verbose_name='Период')),
+                ('period_start', models.DateField(verbose_name='Начало периода')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Продано')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bookstore_app.book', verbose_name='Книга')),
+            ],
+            options={
+                'verbose_name': 'Продажи книги',
+                'verbose_name_plural': 'Продажи книг',
+                'db_table': 'book_sales',
+                'indexes': [models.Index(fields=['period', 'period_start'], name='book_sales_period_idx')],
+                'constraints': [models.UniqueConstraint(fields=('book', 'period', 'period_start'), name='book_sales_book_period_uniq')],
+            },
+        ),
+    ]
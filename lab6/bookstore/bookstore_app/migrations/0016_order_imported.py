@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore_app', '0015_booksales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='imported',
+            field=models.BooleanField(default=False, verbose_name='Перенесён из cookie'),
+        ),
+    ]
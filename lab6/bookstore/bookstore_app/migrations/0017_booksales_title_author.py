@@ -0,0 +1,40 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_book_titles(apps, schema_editor):
+    BookSales = apps.get_model('bookstore_app', 'BookSales')
+    Book = apps.get_model('bookstore_app', 'Book')
+    books = Book.objects.filter(pk=OuterRef('book_id'))
+    BookSales.objects.update(
+        title=Subquery(books.values('title')[:1]),
+        author=Subquery(books.values('author')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore_app', '0016_order_imported'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booksales',
+            name='title',
+            field=models.CharField(default='', max_length=200, verbose_name='Название'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='booksales',
+            name='author',
+            field=models.CharField(default='', max_length=200, verbose_name='Автор'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_book_titles, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='booksales',
+            name='book',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bookstore_app.book', verbose_name='Книга'),
+        ),
+    ]
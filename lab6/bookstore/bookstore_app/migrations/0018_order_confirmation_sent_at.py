@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore_app', '0017_booksales_title_author'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='confirmation_sent_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Подтверждение отправлено'),
+        ),
+    ]
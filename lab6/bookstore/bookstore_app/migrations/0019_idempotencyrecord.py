@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookstore_app', '0018_order_confirmation_sent_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyRecord',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Ключ')),
+                ('response', models.BinaryField(null=True, verbose_name='Ответ')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Действует до')),
+            ],
+            options={
+                'verbose_name': 'Ключ идемпотентности',
+                'verbose_name_plural': 'Ключи идемпотентности',
+                'db_table': 'idempotency_record',
+            },
+        ),
+    ]
@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 
 # Create your models here.
@@ -11,6 +13,8 @@ class Book(models.Model):
     publisher = models.CharField(max_length=200, verbose_name="Издатель",
                                  blank=True, null=True)
     cost = models.FloatField(verbose_name="Стоимость")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True,
+                                      verbose_name="Изменено")
 
     def __str__(self):
         return self.title
@@ -20,4 +24,238 @@ class Book(models.Model):
         verbose_name = "Книга"
         verbose_name_plural = "Книги"
         ordering = ['title']
+        indexes = [
+            # Ключ keyset-пагинации каталога
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+            # Предикат cost в поисковых запросах; author: и publisher:
+            # обслуживают поисковые индексы из search.py
+            models.Index(fields=['cost', 'id'], name='book_cost_id_idx'),
+        ]
 
+
+class CartItem(models.Model):
+    # "user:<id>" для пользователя или "anon:<токен>" для гостя
+    owner = models.CharField(max_length=64, verbose_name="Владелец")
+    book = models.ForeignKey(Book, on_delete=models.CASCADE,
+                             verbose_name="Книга")
+    quantity = models.PositiveIntegerField(default=1,
+                                           verbose_name="Количество")
+    # Цена, которую покупатель видел, добавляя книгу (см. pricing.py)
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True,
+                                blank=True, verbose_name="Цена при добавлении")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Изменено")
+
+    def __str__(self):
+        return f"{self.owner}: {self.book_id} x {self.quantity}"
+
+    class Meta:
+        db_table = "cart_item"
+        verbose_name = "Строка корзины"
+        verbose_name_plural = "Строки корзины"
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'book'],
+                                    name='cart_item_owner_book_uniq'),
+        ]
+
+
+class Order(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE, related_name='orders',
+                             verbose_name="Покупатель")
+    created_at = models.DateTimeField(default=timezone.now,
+                                      verbose_name="Оформлен")
+    total_cost = models.DecimalField(max_digits=12, decimal_places=2,
+                                     verbose_name="Итоговая стоимость")
+    # Перенесён из прежней неподписанной cookie: суммы задал клиент, поэтому
+    # в сводки OrderStats и продаж такой заказ не входит
+    imported = models.BooleanField(default=False,
+                                   verbose_name="Перенесён из cookie")
+    # Когда отправлено письмо-подтверждение (см. tasks.py): повтор задачи
+    # не отправляет его второй раз
+    confirmation_sent_at = models.DateTimeField(
+        null=True, blank=True, verbose_name="Подтверждение отправлено")
+    # Покупатель очистил историю заказов: заказ ему больше не показывается,
+    # но остаётся для пересчёта сводки продаж (см. analytics.py)
+    deleted_at = models.DateTimeField(null=True, blank=True,
+                                      verbose_name="Удалён из истории")
+
+    def __str__(self):
+        return f"Заказ {self.pk} от {self.created_at:%Y-%m-%d %H:%M:%S}"
+
+    class Meta:
+        db_table = "book_order"
+        verbose_name = "Заказ"
+        verbose_name_plural = "Заказы"
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # История заказов пользователя, новые первыми
+            models.Index(fields=['user', 'created_at'],
+                         name='order_user_created_idx'),
+        ]
+
+
+class OrderItem(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE,
+                              related_name='items', verbose_name="Заказ")
+    # Название, автор и цена копируются: книгу могут изменить или удалить
+    book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True,
+                             blank=True, verbose_name="Книга")
+    title = models.CharField(max_length=200, verbose_name="Название")
+    author = models.CharField(max_length=200, verbose_name="Автор")
+    quantity = models.PositiveIntegerField(verbose_name="Количество")
+    cost = models.DecimalField(max_digits=10, decimal_places=2,
+                               verbose_name="Цена за единицу")
+
+    def __str__(self):
+        return f"{self.title} x {self.quantity}"
+
+    @property
+    def total_cost(self):
+        return self.cost * self.quantity
+
+    class Meta:
+        db_table = "order_item"
+        verbose_name = "Строка заказа"
+        verbose_name_plural = "Строки заказа"
+        ordering = ['id']
+
+
+class OrderStats(models.Model):
+    """Сводка заказов пользователя. Обновляется вместе с заказами
+    (см. orders.py), пересчитывается командой rebuild_order_stats."""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL,
+                                on_delete=models.CASCADE, primary_key=True,
+                                related_name='order_stats',
+                                verbose_name="Покупатель")
+    orders_count = models.PositiveIntegerField(default=0,
+                                               verbose_name="Заказов")
+    total_spent = models.DecimalField(max_digits=14, decimal_places=2,
+                                      default=0, verbose_name="Потрачено")
+    books_bought = models.PositiveIntegerField(default=0,
+                                               verbose_name="Куплено книг")
+
+    def __str__(self):
+        return f"{self.user_id}: {self.orders_count} заказов"
+
+    class Meta:
+        db_table = "order_stats"
+        verbose_name = "Сводка заказов"
+        verbose_name_plural = "Сводки заказов"
+
+
+class Job(models.Model):
+    """Фоновая задача, которую выполняет команда run_jobs (см. jobs.py)."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Ожидает'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    name = models.CharField(max_length=100, verbose_name="Задача")
+    payload = models.JSONField(default=dict, verbose_name="Параметры")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=PENDING, verbose_name="Состояние")
+    attempts = models.PositiveSmallIntegerField(default=0,
+                                                verbose_name="Попыток")
+    run_after = models.DateTimeField(default=timezone.now,
+                                     verbose_name="Не раньше")
+    locked_at = models.DateTimeField(null=True, blank=True,
+                                     verbose_name="Взята в работу")
+    locked_by = models.CharField(max_length=100, blank=True,
+                                 verbose_name="Обработчик")
+    last_error = models.TextField(blank=True, verbose_name="Последняя ошибка")
+    created_at = models.DateTimeField(auto_now_add=True,
+                                      verbose_name="Создана")
+    finished_at = models.DateTimeField(null=True, blank=True,
+                                       verbose_name="Завершена")
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+    class Meta:
+        db_table = "job"
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        indexes = [
+            # Выборка готовых к выполнению задач обработчиком
+            models.Index(fields=['status', 'run_after'],
+                         name='job_status_run_after_idx'),
+        ]
+
+
+class Counter(models.Model):
+    """Общий для рабочих процессов счётчик: версия каталога и статистика
+    кэшей (см. caching.py). Увеличивается атомарным UPDATE."""
+    name = models.CharField(max_length=100, primary_key=True,
+                            verbose_name="Имя")
+    value = models.BigIntegerField(default=0, verbose_name="Значение")
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+    class Meta:
+        db_table = "counter"
+        verbose_name = "Счётчик"
+        verbose_name_plural = "Счётчики"
+
+
+class IdempotencyRecord(models.Model):
+    """Ответ на запрос с ключом идемпотентности (см. idempotency.py)."""
+    # sha256 от покупателя, пути запроса и ключа клиента
+    key = models.CharField(max_length=64, primary_key=True,
+                           verbose_name="Ключ")
+    # Сериализованный ответ; пусто, пока первый запрос выполняется
+    response = models.BinaryField(null=True, verbose_name="Ответ")
+    expires_at = models.DateTimeField(db_index=True,
+                                      verbose_name="Действует до")
+
+    def __str__(self):
+        return self.key
+
+    class Meta:
+        db_table = "idempotency_record"
+        verbose_name = "Ключ идемпотентности"
+        verbose_name_plural = "Ключи идемпотентности"
+
+
+class BookSales(models.Model):
+    """Продажи книги за день или (после сжатия) за месяц. Обновляется
+    вместе с заказами, см. analytics.py."""
+    DAY = 'day'
+    MONTH = 'month'
+    PERIOD_CHOICES = [(DAY, 'День'), (MONTH, 'Месяц')]
+
+    # Продажи удалённой книги остаются в отчётах под сохранённым названием
+    book = models.ForeignKey(Book, on_delete=models.SET_NULL, null=True,
+                             blank=True, verbose_name="Книга")
+    title = models.CharField(max_length=200, verbose_name="Название")
+    author = models.CharField(max_length=200, verbose_name="Автор")
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES,
+                              default=DAY, verbose_name="Период")
+    period_start = models.DateField(verbose_name="Начало периода")
+    quantity = models.PositiveIntegerField(default=0,
+                                           verbose_name="Продано")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2,
+                                  default=0, verbose_name="Выручка")
+
+    def __str__(self):
+        return f"{self.title} {self.period_start}: {self.quantity}"
+
+    class Meta:
+        db_table = "book_sales"
+        verbose_name = "Продажи книги"
+        verbose_name_plural = "Продажи книг"
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'period', 'period_start'],
+                                    name='book_sales_book_period_uniq'),
+        ]
+        indexes = [
+            # Бестселлеры и отчёт читают строки за последние дни
+            models.Index(fields=['period', 'period_start'],
+                         name='book_sales_period_idx'),
+        ]
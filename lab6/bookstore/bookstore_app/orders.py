@@ -0,0 +1,144 @@
+"""
+Оформление и хранение заказов.
+
+Заказ пишется в таблицы book_order и order_item в одной транзакции:
+один INSERT заказа и один bulk_create строк. В той же транзакции
+обновляется сводка пользователя OrderStats (число заказов, сумма, число
+книг), поэтому страницам не нужно пересуммировать все заказы. Дневные
+продажи книг (см. analytics.py) обновляются после фиксации транзакции.
+
+Раньше заказы хранились JSON-списком в cookie orders_<username>; такие
+cookie переносятся в БД функцией import_legacy_orders при первом обращении
+к истории заказов. Cookie не подписана, и её содержимое мог задать сам
+клиент, поэтому перенесённые заказы помечаются imported и видны только в
+истории покупателя: в OrderStats и сводки продаж они не входят.
+
+Очистка истории не удаляет заказы, а помечает их deleted_at: покупатель их
+больше не видит, и из OrderStats они вычитаются, но проданное остаётся
+в сводке продаж и при её пересчёте.
+"""
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .analytics import record_order_sales
+from .models import Order, OrderItem, OrderStats
+
+LEGACY_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def create_order(user, lines, total_cost, created_at=None, imported=False):
+    """Создаёт заказ из строк корзины (см. pricing.CartPricing)."""
+    with transaction.atomic():
+        order = Order.objects.create(
+            user=user, total_cost=total_cost,
+            created_at=created_at or timezone.now(), imported=imported)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, book_id=line['book_id'],
+                      title=line['title'], author=line['author'],
+                      quantity=line['quantity'], cost=line['cost'])
+            for line in lines])
+        if not imported:
+            add_order_stats(user, 1, total_cost,
+                            sum(line['quantity'] for line in lines))
+            record_order_sales(order, lines)
+    return order
+
+
+def add_order_stats(user, orders_count, total_spent, books_bought):
+    """Прибавляет значения (в том числе отрицательные) к сводке
+    пользователя. Вызывается внутри транзакции, изменяющей заказы."""
+    stats = OrderStats.objects.filter(user=user)
+    changes = {
+        'orders_count': F('orders_count') + orders_count,
+        'total_spent': F('total_spent') + total_spent,
+        'books_bought': F('books_bought') + books_bought,
+    }
+    if stats.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            OrderStats.objects.create(user=user, orders_count=orders_count,
+                                      total_spent=total_spent,
+                                      books_bought=books_bought)
+    except IntegrityError:
+        # Сводку только что создал параллельный запрос
+        stats.update(**changes)
+
+
+def delete_orders(user):
+    """Убирает все заказы пользователя из его истории и вычитает их из
+    сводки."""
+    with transaction.atomic():
+        # Блокировка сводки не даёт параллельному заказу попасть между
+        # подсчётом и удалением
+        list(OrderStats.objects.select_for_update().filter(user=user))
+        orders = Order.objects.filter(user=user, deleted_at=None)
+        totals = orders.filter(imported=False).aggregate(
+            orders_count=Count('id'), total_spent=Sum('total_cost'))
+        books_bought = OrderItem.objects.filter(
+            order__user=user, order__imported=False,
+            order__deleted_at=None).aggregate(
+            books_bought=Sum('quantity'))['books_bought']
+        orders.update(deleted_at=timezone.now())
+        if totals['orders_count']:
+            add_order_stats(user, -totals['orders_count'],
+                            -totals['total_spent'], -(books_bought or 0))
+
+
+def get_order_stats(user):
+    """Сводка пользователя; у пользователя без заказов — нулевая."""
+    return OrderStats.objects.filter(user=user).first() or \
+        OrderStats(user=user)
+
+
+def compute_order_stats():
+    """Считает сводки заново по таблицам заказов двумя запросами с
+    группировкой. Возвращает {user_id: (orders_count, total_spent,
+    books_bought)}."""
+    orders = Order.objects.filter(imported=False, deleted_at=None).order_by()
+    stats = {row['user']: [row['orders_count'], row['total_spent'], 0]
+             for row in orders.values('user').annotate(
+                 orders_count=Count('id'), total_spent=Sum('total_cost'))}
+    for row in OrderItem.objects.filter(
+            order__imported=False, order__deleted_at=None).order_by() \
+            .values('order__user').annotate(books_bought=Sum('quantity')):
+        stats[row['order__user']][2] = row['books_bought']
+    return {user_id: tuple(values) for user_id, values in stats.items()}
+
+
+def import_legacy_orders(user, value):
+    """Переносит заказы из прежней cookie в БД с пометкой imported.
+    Повреждённые записи пропускаются. Возвращает число перенесённых
+    заказов."""
+    try:
+        orders = json.loads(value)
+    except json.JSONDecodeError:
+        return 0
+    if not isinstance(orders, list):
+        return 0
+    imported = 0
+    with transaction.atomic():
+        for order in orders:
+            try:
+                created_at = timezone.make_aware(
+                    datetime.strptime(order['date'], LEGACY_DATE_FORMAT))
+                lines = [{
+                    # Книгу с тех пор могли удалить, ссылка не сохраняется
+                    'book_id': None,
+                    'title': item['title'],
+                    'author': item['author'],
+                    'quantity': int(item['quantity']),
+                    'cost': Decimal(item['cost']),
+                } for item in order['items'].values()]
+                total_cost = Decimal(order['total_cost'])
+            except (KeyError, TypeError, ValueError, AttributeError,
+                    InvalidOperation):
+                continue
+            create_order(user, lines, total_cost, created_at, imported=True)
+            imported += 1
+    return imported
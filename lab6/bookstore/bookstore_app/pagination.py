@@ -0,0 +1,269 @@
+"""
+Пагинация каталога.
+
+Keyset-пагинация (seek-пагинация): вместо OFFSET и COUNT(*) страница
+выбирается условием (title, id) > (последний title, последний id) с
+границей title >= последний title, по которой индекс book_title_id_idx
+просматривается с позиции курсора, поэтому стоимость страницы не зависит
+от её номера. Позиция передаётся клиенту непрозрачным курсором. Так же
+листается история заказов по ключу (created_at, id) в обратном порядке.
+
+Нумерованная пагинация: CachedCountPaginator кэширует COUNT(*) по
+нормализованному запросу, а на больших выборках берёт оценку планировщика.
+"""
+import base64
+import binascii
+import json
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .caching import make_catalog_key
+
+FORWARD = 'n'
+BACKWARD = 'p'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(direction, value, pk):
+    # Дата хранится в ISO 8601: такую строку Django принимает в фильтре
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    raw = json.dumps([direction, value, pk], ensure_ascii=False,
+                     separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode(
+        'ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (direction, value, pk) или бросает InvalidCursor."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, value, pk = json.loads(raw.decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise InvalidCursor(token)
+    if direction not in (FORWARD, BACKWARD) or not isinstance(value, str) \
+            or not isinstance(pk, int):
+        raise InvalidCursor(token)
+    return direction, value, pk
+
+
+class KeysetPage:
+    """Страница keyset-пагинации. Повторяет ту часть интерфейса
+    django.core.paginator.Page, которой пользуются шаблоны."""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next or not self.object_list:
+            return ''
+        return encode_cursor(FORWARD, *self.paginator.key(
+            self.object_list[-1]))
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous or not self.object_list:
+            return ''
+        return encode_cursor(BACKWARD, *self.paginator.key(
+            self.object_list[0]))
+
+
+class KeysetPaginator:
+    """Пагинатор по ключу (field, id), по умолчанию (title, id). Не
+    выполняет COUNT(*): для каждой страницы выбирается per_page + 1 строка,
+    лишняя строка лишь сообщает, есть ли следующая страница.
+
+    key извлекает (значение field, id) из строки выборки; для выборок
+    values_list его нужно передать явно. descending листает от больших
+    ключей к меньшим (новые заказы первыми)."""
+
+    def __init__(self, queryset, per_page, key=attrgetter('title', 'pk'),
+                 field='title', descending=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.key = key
+        self.field = field
+        self.descending = descending
+
+    def seek(self, queryset, lookup, value, pk):
+        """(field, id) после (value, pk) в направлении lookup ('gt' или
+        'lt'). Условие field >= value (<= для 'lt') повторяет первую часть
+        дизъюнкции, но только с ним планировщик начинает просмотр индекса
+        с позиции курсора: одно OR он проверяет фильтром на каждой строке
+        индекса от её начала."""
+        field = self.field
+        return queryset.filter(
+            Q(**{f'{field}__{lookup}e': value}),
+            Q(**{f'{field}__{lookup}': value}) |
+            Q(**{field: value, f'pk__{lookup}': pk}))
+
+    def page(self, cursor=None):
+        """Возвращает страницу по курсору; пустой или повреждённый курсор
+        означает первую страницу."""
+        try:
+            direction, value, pk = decode_cursor(cursor) if cursor \
+                else (None, None, None)
+        except InvalidCursor:
+            direction = None
+
+        queryset = self.queryset
+        after, before = ('lt', 'gt') if self.descending else ('gt', 'lt')
+        try:
+            if direction == FORWARD:
+                queryset = self.seek(queryset, after, value, pk)
+            elif direction == BACKWARD:
+                queryset = self.seek(queryset, before, value, pk)
+        except ValidationError:
+            # Значение из курсора не подходит к полю (например, не дата)
+            direction = None
+
+        ordering = [self.field, 'pk']
+        reverse_ordering = [f'-{self.field}', '-pk']
+        if self.descending:
+            ordering, reverse_ordering = reverse_ordering, ordering
+
+        if direction == BACKWARD:
+            rows = list(queryset.order_by(*reverse_ordering)[
+                        :self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return KeysetPage(rows, self, has_next=True,
+                              has_previous=has_more)
+
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        return KeysetPage(rows[:self.per_page], self, has_next=has_more,
+                          has_previous=direction == FORWARD)
+
+
+def is_small_result(queryset, limit, count_key='', catalog_version=None):
+    """Проверяет, что в выборке не больше limit строк. Если
+    CachedCountPaginator уже посчитал строки под тем же count_key, ответ
+    берётся из его кэша, иначе — из кэша прошлых проверок для этой версии
+    каталога. Только при промахе обоих выполняется подсчёт, ограниченный
+    подзапросом с LIMIT: он стоит не больше чтения limit + 1 строк."""
+    count_cache_key = make_catalog_key('count', count_key,
+                                       version=catalog_version)
+    small_key = make_catalog_key('small', count_key, limit,
+                                 version=catalog_version)
+    cached = cache.get_many([count_cache_key, small_key])
+    if count_cache_key in cached:
+        estimated, count = cached[count_cache_key]
+        return not estimated and count <= limit
+    if small_key in cached:
+        return cached[small_key]
+    small = queryset[:limit + 1].count() <= limit
+    cache.set(small_key, small, settings.BOOK_COUNT_CACHE_TIMEOUT)
+    return small
+
+
+def estimate_count(queryset):
+    """Возвращает оценку числа строк от планировщика PostgreSQL или None,
+    если оценка недоступна."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class '
+                           'WHERE oid = %s::regclass',
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+            # До первого ANALYZE reltuples равен -1
+            return row[0] if row and row[0] >= 0 else None
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, кэширующий число строк под ключом count_key (обычно это
+    нормализованный поисковый запрос). Если оценка планировщика больше
+    BOOK_COUNT_ESTIMATE_THRESHOLD, точный COUNT(*) не выполняется и
+    is_estimated становится истинным."""
+
+    def __init__(self, object_list, per_page, count_key='',
+                 catalog_version=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+        self.catalog_version = catalog_version
+        self._estimated = False
+
+    @cached_property
+    def count(self):
+        key = make_catalog_key('count', self.count_key,
+                               version=self.catalog_version)
+        cached = cache.get(key)
+        if cached is not None:
+            self._estimated, count = cached
+            return count
+
+        count = None
+        threshold = settings.BOOK_COUNT_ESTIMATE_THRESHOLD
+        if threshold is not None:
+            estimate = estimate_count(self.object_list)
+            if estimate is not None and estimate > threshold:
+                count, self._estimated = estimate, True
+        if count is None:
+            count = self.object_list.count()
+        cache.set(key, (self._estimated, count),
+                  settings.BOOK_COUNT_CACHE_TIMEOUT)
+        return count
+
+    @property
+    def is_estimated(self):
+        self.count
+        return self._estimated
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            # Оценка может быть занижена, поэтому страницы за её пределами
+            # не считаются ошибкой
+            if self.is_estimated and int(number) >= 1:
+                return int(number)
+            raise
+
+    def page(self, number):
+        if not self.is_estimated:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self)
@@ -0,0 +1,89 @@
+"""
+Цены корзины.
+
+Корзина хранит количество и снимок цены — ту цену, которую покупатель видел,
+добавляя книгу. Текущие цены всех строк загружаются из Book одним запросом
+по первичному ключу и запоминаются на время запроса, поэтому повторный
+расчёт после изменения корзины обращается к БД только за новыми книгами.
+Строки, цена которых разошлась со снимком, помечаются, чтобы показать
+покупателю новую цену до оформления заказа.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from .models import Book
+
+CENT = Decimal('0.01')
+
+# lines — строки корзины, changed — те из них, у которых изменилась цена
+PricedCart = namedtuple('PricedCart', 'lines total_cost changed')
+
+
+def to_price(cost):
+    """Цена книги (FloatField) в Decimal с точностью до копейки."""
+    if not cost:
+        return Decimal('0.00')
+    return Decimal(str(cost)).quantize(CENT)
+
+
+class CartPricing:
+    def __init__(self):
+        # book_id -> (title, author, цена) или None, если книги нет
+        self._books = {}
+
+    def load(self, book_ids):
+        missing = [book_id for book_id in book_ids
+                   if book_id not in self._books]
+        if not missing:
+            return
+        found = {pk: (title, author, to_price(cost))
+                 for pk, title, author, cost in Book.objects.filter(
+                     pk__in=missing).values_list('pk', 'title', 'author',
+                                                 'cost')}
+        for book_id in missing:
+            self._books[book_id] = found.get(book_id)
+
+    def prices(self, book_ids):
+        """Текущие цены {book_id: Decimal} для книг, которые есть
+        в каталоге."""
+        self.load(book_ids)
+        return {book_id: self._books[book_id][2] for book_id in book_ids
+                if self._books[book_id] is not None}
+
+    def price_cart(self, cart):
+        """Строки корзины с текущими ценами. Удалённые из каталога книги
+        пропускаются. У строки с изменившейся ценой previous_cost — цена
+        из снимка, у остальных None."""
+        items = cart.items()
+        snapshots = cart.prices()
+        self.load(items)
+        lines, changed = [], []
+        total_cost = Decimal('0.00')
+        for book_id, quantity in items.items():
+            book = self._books[book_id]
+            if book is None:
+                continue
+            title, author, cost = book
+            snapshot = snapshots.get(book_id)
+            line = {
+                'book_id': book_id,
+                'title': title,
+                'author': author,
+                'quantity': quantity,
+                'cost': cost,
+                'total_item_cost': cost * quantity,
+                'previous_cost': snapshot if snapshot is not None and
+                snapshot != cost else None,
+            }
+            lines.append(line)
+            if line['previous_cost'] is not None:
+                changed.append(line)
+            total_cost += line['total_item_cost']
+        return PricedCart(lines, total_cost, changed)
+
+
+def get_cart_pricing(request):
+    """Возвращает сервис цен для запроса (один на запрос)."""
+    if not hasattr(request, '_cart_pricing'):
+        request._cart_pricing = CartPricing()
+    return request._cart_pricing
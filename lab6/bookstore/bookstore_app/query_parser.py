@@ -0,0 +1,53 @@
+"""
+Разбор поисковых запросов каталога.
+
+Строка вида «война author:толстой publisher:"Азбука" cost<300» разбирается
+на предикаты: свободный текст ищется в названии, author: и publisher: —
+в соответствующих полях, cost поддерживает =, <, <=, >, >=. Предикаты
+объединяются через AND; порядок их выполнения и индексы выбирает
+планировщик СУБД.
+"""
+import re
+from collections import namedtuple
+
+TEXT_FIELDS = ('title', 'author', 'publisher')
+NUMERIC_FIELDS = ('cost',)
+
+Predicate = namedtuple('Predicate', 'field op value')
+
+PREDICATE_RE = re.compile(
+    r'(?<!\S)(?P<field>title|author|publisher|cost)'
+    r'(?P<op>:|<=|>=|<|>|=)(?P<value>"[^"]*"|\S+)',
+    re.IGNORECASE)
+
+
+def parse_query(text):
+    """Возвращает список предикатов. Нераспознанные части (в том числе
+    cost с нечисловым значением) остаются свободным текстом."""
+    predicates = []
+
+    def take(match):
+        field = match.group('field').lower()
+        op = match.group('op')
+        value = match.group('value')
+        if value.startswith('"'):
+            value = value[1:-1]
+        if field in NUMERIC_FIELDS:
+            try:
+                value = float(value)
+            except ValueError:
+                return match.group(0)
+            op = '=' if op == ':' else op
+        elif op != ':':
+            return match.group(0)
+        else:
+            value = value.strip()
+            if not value:
+                return ' '
+        predicates.append(Predicate(field, op, value))
+        return ' '
+
+    free_text = ' '.join(PREDICATE_RE.sub(take, text).split())
+    if free_text:
+        predicates.insert(0, Predicate('title', ':', free_text))
+    return predicates
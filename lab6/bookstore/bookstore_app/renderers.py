@@ -0,0 +1,77 @@
+"""
+Быстрый рендеринг строк таблицы книг.
+
+Шаблонизатор Django на каждую ячейку обходит узлы шаблона и на каждую
+строку вызывает reverse() для ссылки «В корзину» (а для администратора ещё
+и для ссылок редактирования и удаления). BookRowRenderer
+собирает тот же HTML из кортежей values_list: URL вычисляются один раз
+как шаблоны, поля экранируются html.escape и склеиваются join.
+"""
+from html import escape
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils.formats import get_format, localize
+from django.utils.safestring import mark_safe
+
+# Порядок полей в кортежах, которые принимает BookRowRenderer
+ROW_FIELDS = ('id', 'title', 'author', 'publisher', 'cost')
+
+_PK_SENTINEL = 2147483647
+
+ROW_HTML = ('<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td>'
+            '<td><a href="{}" class="add-to-cart">В корзину</a></td>{}</tr>')
+ACTIONS_HTML = (
+    '<td><a href="{edit}">Редактировать</a> '
+    '<a href="{delete}" onclick="return confirm(\'Вы уверены?\')">'
+    'Удалить</a></td>'
+)
+
+
+def url_template(name):
+    """URL с подстановкой {pk}, полученный одним вызовом reverse()."""
+    return reverse(name, args=[_PK_SENTINEL]).replace(
+        str(_PK_SENTINEL), '{pk}')
+
+
+def cost_formatter():
+    """Функция форматирования цены, совпадающая с {{ book.cost }}. Без
+    разделителя тысяч localize(float) сводится к str() с заменой десятичного
+    разделителя, а полный localize() нужен только при USE_THOUSAND_SEPARATOR
+    и для чисел в экспоненциальной записи."""
+    if settings.USE_THOUSAND_SEPARATOR:
+        return localize
+    separator = get_format('DECIMAL_SEPARATOR')
+
+    def format_cost(cost):
+        value = str(cost)
+        if 'e' in value:
+            return localize(cost)
+        return value if separator == '.' else value.replace('.', separator)
+    return format_cost
+
+
+class BookRowRenderer:
+    def __init__(self, is_staff=False):
+        self.is_staff = is_staff
+        self.format_cost = cost_formatter()
+        self.add_to_cart_url = escape(url_template('add_to_cart'))
+        if is_staff:
+            self.actions = ACTIONS_HTML.format(
+                edit=escape(url_template('edit_book')),
+                delete=escape(url_template('delete_book')))
+
+    def render(self, rows):
+        """Возвращает безопасную HTML-строку из <tr> для кортежей
+        (id, title, author, publisher, cost)."""
+        parts = []
+        append = parts.append
+        format_cost = self.format_cost
+        add_to_cart_url = self.add_to_cart_url
+        for pk, title, author, publisher, cost in rows:
+            # Как и {{ book.publisher }}, пустое значение выводится как None
+            append(ROW_HTML.format(
+                escape(title), escape(author), escape(str(publisher)),
+                escape(format_cost(cost)), add_to_cart_url.format(pk=pk),
+                self.actions.format(pk=pk) if self.is_staff else ''))
+        return mark_safe(''.join(parts))
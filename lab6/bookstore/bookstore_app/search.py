@@ -0,0 +1,189 @@
+"""
+Поисковые бэкенды каталога книг.
+
+PostgreSQL: колонка tsvector с GIN-индексом по названию и триграммные
+индексы (pg_trgm) по названию, автору и издателю, чтобы подстрочный поиск
+не превращался в полный просмотр.
+SQLite: виртуальная таблица FTS5 с триграммным токенизатором, которую
+синхронизируют триггеры. Для остальных СУБД остаётся обычный icontains.
+Синтаксис запросов разбирается в query_parser.
+
+Индексы создают миграции 0006, 0008 и 0009; если SQLite собран без
+триграммного токенизатора (версии до 3.34), таблицы book_fts нет и поиск
+идёт через icontains.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .query_parser import NUMERIC_FIELDS, TEXT_FIELDS, parse_query
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Триграммный токенизатор FTS5 не находит подстроки короче трёх символов
+FTS5_MIN_QUERY_LENGTH = 3
+
+COST_LOOKUPS = {'=': 'exact', '<': 'lt', '<=': 'lte', '>': 'gt', '>=': 'gte'}
+
+
+def normalize_query(query):
+    """Приводит поисковую строку к каноническому виду (для ключей кэша)."""
+    return ' '.join(query.split()).lower()
+
+
+class BaseSearchBackend:
+    """Поисковый бэкенд: разбирает запрос на предикаты (query_parser) и
+    применяет их к queryset книг. Подклассы переопределяют filter_text()
+    и rank()."""
+    vendor = None
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    def search(self, queryset, query, ranked=False):
+        predicates = parse_query(query)
+        queryset = self.apply_predicates(queryset, predicates)
+        if ranked:
+            ranked_queryset = self.rank(queryset, predicates)
+            if ranked_queryset is not None:
+                return ranked_queryset
+        return queryset.order_by('title')
+
+    def apply_predicates(self, queryset, predicates):
+        for predicate in predicates:
+            queryset = self.filter(queryset, predicate)
+        return queryset
+
+    def filter(self, queryset, predicate):
+        if predicate.field in NUMERIC_FIELDS:
+            lookup = f'{predicate.field}__{COST_LOOKUPS[predicate.op]}'
+            return queryset.filter(**{lookup: predicate.value})
+        return self.filter_text(queryset, predicate.field, predicate.value)
+
+    def filter_text(self, queryset, field, value):
+        return queryset.filter(**{f'{field}__icontains': value})
+
+    def rank(self, queryset, predicates):
+        """Возвращает queryset, упорядоченный по релевантности, или None,
+        если ранжировать нечем."""
+        return None
+
+
+class IcontainsSearchBackend(BaseSearchBackend):
+    """Поиск подстроки без специальных индексов."""
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Для названия — полнотекстовый поиск по префиксам слов плюс поиск
+    подстроки, для автора и издателя — поиск подстроки. Подстроки
+    обслуживают триграммные индексы по UPPER(поле)."""
+    vendor = 'postgresql'
+
+    @staticmethod
+    def to_tsquery(query):
+        tokens = TOKEN_RE.findall(query.lower())
+        return ' & '.join(f'{token}:*' for token in tokens)
+
+    def filter_text(self, queryset, field, value):
+        tsquery = self.to_tsquery(value)
+        if field != 'title' or not tsquery:
+            return super().filter_text(queryset, field, value)
+        table = queryset.model._meta.db_table
+        matches = RawSQL(
+            f"{table}.search_vector @@ to_tsquery('simple', %s)",
+            [tsquery], output_field=BooleanField())
+        return queryset.filter(Q(title__icontains=value) | Q(matches))
+
+    def rank(self, queryset, predicates):
+        tsquery = self.to_tsquery(' '.join(
+            predicate.value for predicate in predicates
+            if predicate.field == 'title'))
+        if not tsquery:
+            return None
+        table = queryset.model._meta.db_table
+        rank = RawSQL(
+            f"ts_rank({table}.search_vector, to_tsquery('simple', %s))",
+            [tsquery], output_field=FloatField())
+        return queryset.annotate(search_rank=rank).order_by(
+            '-search_rank', 'title')
+
+
+# alias подключения -> есть ли таблица book_fts; сбрасывается после
+# миграций (см. signals.py)
+_fts_available = {}
+
+
+class SQLiteFTS5SearchBackend(BaseSearchBackend):
+    """Поиск подстроки через FTS5 с триграммным токенизатором."""
+    vendor = 'sqlite'
+
+    def is_available(self):
+        if self.using not in _fts_available:
+            connection = connections[self.using]
+            _fts_available[self.using] = \
+                'book_fts' in connection.introspection.table_names()
+        return _fts_available[self.using]
+
+    @staticmethod
+    def to_match(query):
+        # Вся строка ищется как одна фраза, то есть как подстрока
+        return '"{}"'.format(query.replace('"', '""'))
+
+    def split_predicates(self, predicates):
+        """Делит предикаты на выражение MATCH и остальные. SQLite использует
+        для таблицы один индекс, поэтому все текстовые предикаты, которые
+        может обслужить FTS5, объединяются в одно выражение."""
+        if not self.is_available():
+            return None, predicates
+        parts, rest = [], []
+        for predicate in predicates:
+            if predicate.field in TEXT_FIELDS and \
+                    len(predicate.value) >= FTS5_MIN_QUERY_LENGTH:
+                parts.append(
+                    f'{predicate.field} : {self.to_match(predicate.value)}')
+            else:
+                rest.append(predicate)
+        return ' AND '.join(parts) or None, rest
+
+    def apply_predicates(self, queryset, predicates):
+        match, rest = self.split_predicates(predicates)
+        if match:
+            queryset = queryset.filter(id__in=RawSQL(
+                'SELECT rowid FROM book_fts WHERE book_fts MATCH %s',
+                [match]))
+        return super().apply_predicates(queryset, rest)
+
+    def rank(self, queryset, predicates):
+        match, _ = self.split_predicates(predicates)
+        if not match:
+            return None
+        # bm25 тем меньше, чем лучше совпадение
+        table = queryset.model._meta.db_table
+        rank = RawSQL(
+            'SELECT -bm25(book_fts) FROM book_fts '
+            f'WHERE book_fts MATCH %s AND rowid = {table}.id',
+            [match], output_field=FloatField())
+        return queryset.annotate(search_rank=rank).order_by(
+            '-search_rank', 'title')
+
+
+VENDOR_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteFTS5SearchBackend,
+}
+
+
+def get_search_backend(using='default'):
+    """Возвращает бэкенд из настройки BOOK_SEARCH_BACKEND, а если она не
+    задана, то бэкенд, соответствующий СУБД подключения."""
+    path = getattr(settings, 'BOOK_SEARCH_BACKEND', None)
+    if path:
+        backend_class = import_string(path)
+    else:
+        backend_class = VENDOR_BACKENDS.get(connections[using].vendor,
+                                            IcontainsSearchBackend)
+    return backend_class(using)
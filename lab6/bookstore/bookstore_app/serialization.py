@@ -0,0 +1,21 @@
+"""
+Быстрая сериализация JSON для API каталога.
+
+Если установлен orjson, используется он (в несколько раз быстрее модуля
+json и сразу возвращает bytes), иначе — стандартный json с компактными
+разделителями.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(data):
+    """Сериализует data в bytes UTF-8."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
@@ -0,0 +1,35 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .caching import bump_catalog_version
+from .models import Book
+from .search import _fts_available
+from .suggest import suggest_index
+
+
+# Версия каталога увеличивается после фиксации транзакции: иначе запрос,
+# пришедший между увеличением и фиксацией, закэшировал бы прежние строки
+# под новой версией
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, **kwargs):
+    book_id, values = instance.pk, (instance.title, instance.author)
+
+    def changed():
+        suggest_index.apply(book_id, values, bump_catalog_version())
+    transaction.on_commit(changed)
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    book_id = instance.pk
+
+    def deleted():
+        suggest_index.apply(book_id, None, bump_catalog_version())
+    transaction.on_commit(deleted)
+
+
+@receiver(post_migrate)
+def migrated(sender, using, **kwargs):
+    # Миграции могли создать или удалить таблицу book_fts
+    _fts_available.pop(using, None)
@@ -0,0 +1,74 @@
+"""
+Объединение одинаковых одновременных вычислений (single-flight).
+
+Если несколько потоков рабочего процесса одновременно запрашивают одну и ту
+же страницу каталога, запрос к БД выполняет только первый из них
+(ведущий), а остальные ждут его результат. Считаются только ожидания
+(coalesced) и таймауты, а ведущие нет: так обычный запрос, единственный
+со своим ключом, ничего не записывает. Счётчики переносятся в таблицу
+counter (см. caching.incr_counter), поэтому их видно и из
+management-команды singleflight_stats.
+"""
+import threading
+
+from .caching import get_counters, incr_counter, reset_counters
+
+STATS_KEYS = {
+    'coalesced': 'bookstore:singleflight:coalesced',
+    'timeouts': 'bookstore:singleflight:timeouts',
+}
+
+
+def get_stats():
+    values = get_counters(list(STATS_KEYS.values()))
+    return {name: values[key] for name, key in STATS_KEYS.items()}
+
+
+def reset_stats():
+    reset_counters(list(STATS_KEYS.values()))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, timeout=None):
+        """Возвращает func() для key, выполняя не больше одного вызова
+        одновременно. Если ведущий не успел за timeout секунд, ожидающий
+        поток вычисляет результат сам."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if leader:
+            try:
+                call.result = func()
+            except Exception as exc:
+                call.error = exc
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+            return call.result
+
+        if not call.done.wait(timeout):
+            incr_counter(STATS_KEYS['timeouts'])
+            return func()
+        incr_counter(STATS_KEYS['coalesced'])
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+catalog_flight = SingleFlight()
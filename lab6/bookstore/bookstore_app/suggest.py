@@ -0,0 +1,196 @@
+"""
+Подсказки для поиска по мере ввода.
+
+Каждый рабочий процесс держит в памяти нормализованные название и автора
+каждой книги и отсортированный массив ссылок на начала слов в них: ключ
+ссылки — хвост строки от этого слова до конца. Сами хвосты не хранятся,
+ссылка упакована в одно 64-битное число массива array, поэтому на слово
+приходится 8 байт. Запрос по префиксу отвечается двоичным поиском, не
+обращаясь к БД.
+
+Изменения книг этого процесса применяются из сигналов Book: места ссылок
+книги находятся двоичным поиском (O(слов * log n) сравнений строк), но
+вставка в массив и удаление из него сдвигают его хвост, так что изменение
+всё равно стоит O(n) — правда, это один memmove по 8 байт на слово, а не
+пересортировка. Изменения, сделанные другими процессами, обнаруживаются по
+версии каталога, и тогда индекс перестраивается целиком в фоновом потоке:
+запрос, заметивший новую версию, не ждёт перестройки, а до её конца
+подсказки идут из прежнего индекса (до первой постройки их нет).
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.db import connections
+
+from .caching import get_catalog_version
+from .models import Book
+
+FIELDS = ('title', 'author')
+
+# Сколько ключей просматривать на каждую запрошенную подсказку
+SCAN_FACTOR = 10
+
+# Ссылка: book_id << REF_SHIFT | поле << OFFSET_BITS | смещение слова
+OFFSET_BITS = 16
+REF_SHIFT = OFFSET_BITS + 1
+OFFSET_MASK = (1 << OFFSET_BITS) - 1
+
+
+def normalize(text):
+    return ' '.join(text.lower().replace('ё', 'е').split())
+
+
+def _refs(book_id, texts):
+    """Ссылки на начала слов нормализованных строк книги."""
+    for field, text in enumerate(texts):
+        offset = 0
+        while offset < len(text):
+            yield book_id << REF_SHIFT | field << OFFSET_BITS | offset
+            offset = text.find(' ', offset)
+            if offset < 0:
+                break
+            offset += 1
+
+
+def _unpack(ref):
+    return ref >> REF_SHIFT, ref >> OFFSET_BITS & 1, ref & OFFSET_MASK
+
+
+def _key_function(texts):
+    """Ключ сортировки ссылки: хвост строки от слова, на которое она
+    указывает."""
+    def key(ref):
+        book_id, field, offset = _unpack(ref)
+        return texts[book_id][field][offset:]
+    return key
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._refs = array('q')
+        # book_id -> (title, author) для ответа и нормализованные строки
+        # для сравнения ключей
+        self._books = {}
+        self._texts = {}
+        self._key = _key_function(self._texts)
+        self._lock = threading.Lock()
+        self.version = None
+        self.checked_at = 0.0
+
+    def __len__(self):
+        return len(self._refs)
+
+    def build(self, rows, version):
+        """rows — итерируемое из (id, title, author)."""
+        books, texts = {}, {}
+        for book_id, title, author in rows:
+            books[book_id] = (title, author)
+            texts[book_id] = (normalize(title or ''), normalize(author or ''))
+        key = _key_function(texts)
+        # Сортировка устойчива: одинаковые ключи остаются в порядке ссылок,
+        # как их вставляет apply
+        refs = sorted(ref for book_id, book_texts in texts.items()
+                      for ref in _refs(book_id, book_texts))
+        refs = array('q', sorted(refs, key=key))
+        with self._lock:
+            self._refs, self._books, self._texts = refs, books, texts
+            self._key = key
+            self.version = version
+
+    def apply(self, book_id, values, version):
+        """Обновляет одну книгу (values=None — удаление). Если версия
+        каталога ушла дальше, чем на одно изменение, значит, были изменения
+        в других процессах: индекс помечается устаревшим."""
+        with self._lock:
+            if self.version is None:
+                return
+            if self.version != version - 1:
+                self.version = None
+                return
+            if book_id in self._texts:
+                for ref in _refs(book_id, self._texts[book_id]):
+                    del self._refs[self._position(ref)]
+                del self._texts[book_id]
+                del self._books[book_id]
+            if values is not None:
+                title, author = values
+                self._books[book_id] = values
+                self._texts[book_id] = (normalize(title or ''),
+                                        normalize(author or ''))
+                for ref in _refs(book_id, self._texts[book_id]):
+                    self._refs.insert(self._position(ref), ref)
+            self.version = version
+
+    def _position(self, ref):
+        """Место ссылки в массиве: среди равных ключей ссылки упорядочены
+        по значению."""
+        refs, key = self._refs, self._key(ref)
+        low = bisect_left(refs, key, key=self._key)
+        high = bisect_right(refs, key, low, key=self._key)
+        return bisect_left(refs, ref, low, high)
+
+    def lookup(self, prefix, limit=10):
+        """Возвращает до limit подсказок [{'text', 'kind'}]: сначала
+        совпадения с началом строки, затем с началом слова."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        # Блокировка нужна, потому что apply меняет массив на месте; поиск
+        # и изменение одной книги занимают микросекунды
+        with self._lock:
+            refs = self._refs
+            start = bisect_left(refs, prefix, key=self._key)
+            candidates = []
+            for i in range(start, min(start + limit * SCAN_FACTOR,
+                                      len(refs))):
+                if not self._key(refs[i]).startswith(prefix):
+                    break
+                candidates.append(_unpack(refs[i]))
+            books = self._books
+            # Сортировка устойчива, поэтому внутри групп сохраняется алфавит
+            candidates.sort(key=lambda ref: ref[2] > 0)
+
+            seen, suggestions = set(), []
+            for book_id, field, _ in candidates:
+                text = books[book_id][field]
+                if (field, text) in seen:
+                    continue
+                seen.add((field, text))
+                suggestions.append({'text': text, 'kind': FIELDS[field]})
+                if len(suggestions) == limit:
+                    break
+        return suggestions
+
+
+suggest_index = PrefixIndex()
+# Занята, пока фоновый поток строит индекс
+_rebuilding = threading.Lock()
+
+
+def _rebuild(index, version):
+    try:
+        index.build(Book.objects.values_list('id', 'title', 'author')
+                    .iterator(), version)
+    finally:
+        # Соединение с БД у потока своё
+        connections.close_all()
+        _rebuilding.release()
+
+
+def get_suggest_index():
+    """Возвращает индекс процесса. Версия каталога проверяется не чаще
+    раза в BOOK_SUGGEST_CHECK_INTERVAL секунд; если индекс от неё отстал,
+    запускается его перестройка в фоновом потоке (одна на процесс)."""
+    index = suggest_index
+    now = time.monotonic()
+    if now - index.checked_at < settings.BOOK_SUGGEST_CHECK_INTERVAL:
+        return index
+    index.checked_at = now
+    version = get_catalog_version()
+    if version != index.version and _rebuilding.acquire(blocking=False):
+        threading.Thread(target=_rebuild, args=(index, version),
+                         name='suggest-rebuild', daemon=True).start()
+    return index
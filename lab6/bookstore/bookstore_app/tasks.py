@@ -0,0 +1,41 @@
+"""
+Обработчики фоновых задач (см. jobs.py). Модуль импортируется в
+BookstoreAppConfig.ready(), чтобы обработчики были зарегистрированы
+и в веб-процессе, и в run_jobs.
+"""
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .jobs import task
+from .models import Order
+
+
+@task('order_confirmation')
+def send_order_confirmation(order_id):
+    """Письмо с составом заказа. Заказ, убранный покупателем из истории,
+    пропускается.
+
+    Задачу могут выполнить повторно: её вернёт в очередь requeue_stale_jobs,
+    пока медленный обработчик ещё работает. Поэтому перед отправкой заказ
+    помечается условным UPDATE, который применит только один обработчик.
+    Если отправка не удалась, отметка снимается и задача повторится;
+    если обработчик упал между отметкой и отправкой, письмо теряется —
+    это лучше, чем два одинаковых письма."""
+    order = Order.objects.select_related('user').prefetch_related(
+        'items').filter(pk=order_id, deleted_at=None).first()
+    if order is None or not order.user.email:
+        return
+    sent_at = timezone.now()
+    if not Order.objects.filter(pk=order.pk, confirmation_sent_at=None) \
+            .update(confirmation_sent_at=sent_at):
+        return
+    body = render_to_string('bookstore_app/order_confirmation.txt',
+                            {'order': order})
+    try:
+        send_mail(f'Заказ №{order.pk} оформлен', body, None,
+                  [order.user.email])
+    except Exception:
+        Order.objects.filter(pk=order.pk, confirmation_sent_at=sent_at) \
+            .update(confirmation_sent_at=None)
+        raise
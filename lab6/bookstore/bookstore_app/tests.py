@@ -1,3 +1,135 @@
-from django.test import TestCase
+import base64
+import json
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import signing
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from bookstore_app import hashers
+from bookstore_app.carts import CART_COOKIE_SALT, _pack_varint, \
+    decode_cart_cookie, encode_cart_cookie
+from bookstore_app.hashers import CustomSHA256PasswordHasher
+
+
+# Хэширование в потоке теста, без пула процессов
+@override_settings(BOOK_HASHING_WORKERS=0)
+class LoginHashingTests(TestCase):
+    """Вход должен хэшировать пароль один раз на попытку."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader', 'reader@example.com',
+                                             'secret-password')
+
+    def login(self, username, password):
+        with mock.patch.object(hashers, 'run_hash',
+                               wraps=hashers.run_hash) as run_hash:
+            response = self.client.post(reverse('login'), {
+                'username': username, 'password': password})
+        return response, run_hash.call_count
+
+    def test_successful_login_hashes_once(self):
+        response, hashes = self.login('reader', 'secret-password')
+        self.assertRedirects(response, reverse('book_list'),
+                             fetch_redirect_response=False)
+        self.assertEqual(hashes, 1)
+        self.assertIn('auth;dur=', response['Server-Timing'])
+
+    def test_wrong_password_hashes_once(self):
+        response, hashes = self.login('reader', 'wrong-password')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(hashes, 1)
+        self.assertIn('auth;dur=', response['Server-Timing'])
+
+    def test_unknown_user_hashes_once(self):
+        # Django хэширует пароль и для несуществующего пользователя, чтобы
+        # время ответа не выдавало, есть ли такой логин
+        response, hashes = self.login('nobody', 'secret-password')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(hashes, 1)
+
+    def test_legacy_hash_is_upgraded_on_login(self):
+        # Проверка по старому хэшу и пересохранение пароля новым хэшером
+        legacy = CustomSHA256PasswordHasher()
+        self.user.password = legacy.encode('secret-password', legacy.salt())
+        self.user.save()
+        response, hashes = self.login('reader', 'secret-password')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(hashes, 2)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('custom_sha256_v2$'))
+
+
+class CartCookieTests(SimpleTestCase):
+    """Двоичный формат cookie корзины и чтение прежних форматов."""
+
+    @staticmethod
+    def sign(payload):
+        token = base64.urlsafe_b64encode(bytes(payload)).rstrip(b'=')
+        return signing.Signer(salt=CART_COOKIE_SALT).sign(
+            token.decode('ascii'))
+
+    def test_round_trip(self):
+        items = {1: 2, 300: 1, 2 ** 40: 150}
+        prices = {1: Decimal('12.34'), 2 ** 40: Decimal('0.00')}
+        self.assertEqual(decode_cart_cookie(encode_cart_cookie(items, prices)),
+                         (items, prices))
+
+    def test_round_trip_without_prices(self):
+        self.assertEqual(decode_cart_cookie(encode_cart_cookie({5: 3})),
+                         ({5: 3}, {}))
+
+    def test_empty_cart(self):
+        self.assertEqual(decode_cart_cookie(encode_cart_cookie({})), ({}, {}))
+        self.assertEqual(decode_cart_cookie(''), ({}, {}))
+
+    def test_version_1(self):
+        # Пары (book_id, quantity), без цен
+        payload = bytearray([1])
+        for value in (7, 2, 1000, 1):
+            _pack_varint(value, payload)
+        self.assertEqual(decode_cart_cookie(self.sign(payload)),
+                         ({7: 2, 1000: 1}, {}))
+
+    def test_legacy_json(self):
+        value = json.dumps({'3': {'quantity': 2, 'cost': '150.50',
+                                  'title': 'Война и мир'},
+                            '4': {'quantity': 1}})
+        self.assertEqual(decode_cart_cookie(value),
+                         ({3: 2, 4: 1}, {3: Decimal('150.50')}))
+        self.assertEqual(decode_cart_cookie('{"8": 5}'), ({8: 5}, {}))
+
+    def test_broken_legacy_json(self):
+        for value in ('{"3": ', '{"x": 1}', '{"3": {"cost": "1"}}',
+                      '{"3": {"quantity": 1, "cost": "abc"}}'):
+            with self.subTest(value=value):
+                self.assertEqual(decode_cart_cookie(value), ({}, {}))
+
+    def test_zero_quantity_is_dropped(self):
+        self.assertEqual(decode_cart_cookie(encode_cart_cookie({1: 0, 2: 1})),
+                         ({2: 1}, {}))
+
+    def test_bad_signature(self):
+        value = encode_cart_cookie({1: 2})
+        token, signature = value.rsplit(':', 1)
+        tampered = encode_cart_cookie({1: 99}).rsplit(':', 1)[0]
+        self.assertEqual(decode_cart_cookie(f'{tampered}:{signature}'),
+                         ({}, {}))
+        self.assertEqual(decode_cart_cookie(token), ({}, {}))
+
+    def test_malformed_payload(self):
+        truncated = bytearray([2])
+        _pack_varint(1, truncated)
+        _pack_varint(2, truncated)
+        _pack_varint(300, truncated)
+        for payload in (truncated[:-1],            # обрезанный varint
+                        truncated[:-2],            # неполная тройка
+                        bytearray([9, 1, 1, 1]),   # неизвестная версия
+                        bytearray()):
+            with self.subTest(payload=bytes(payload)):
+                self.assertEqual(decode_cart_cookie(self.sign(payload)),
+                                 ({}, {}))
+        self.assertEqual(decode_cart_cookie(
+            signing.Signer(salt=CART_COOKIE_SALT).sign('!!')), ({}, {}))
@@ -4,6 +4,10 @@ from . import views
 
 urlpatterns = [
     path('', views.BookListView.as_view(), name='book_list'),
+    path('api/books/', views.book_list_api, name='book_list_api'),
+    path('suggest/', views.suggest, name='suggest'),
+    path('bestsellers/', views.bestsellers, name='bestsellers'),
+    path('sales-report/', views.sales_report, name='sales_report'),
     path('add/', views.add_book, name='add_book'),
     path('edit/<int:pk>/', views.edit_book, name='edit_book'),
     path('delete/<int:pk>/', views.delete_book, name='delete_book'),
@@ -13,6 +17,8 @@ urlpatterns = [
     path('profile/', views.profile, name='profile'),
     path('cart/', views.cart_view, name='cart'),
     path('add-to-cart/<int:book_id>/', views.add_to_cart, name='add_to_cart'),
+    path('add-to-cart/batch/', views.add_to_cart_batch,
+         name='add_to_cart_batch'),
     path('remove-from-cart/<int:book_id>/', views.remove_from_cart,
          name='remove_from_cart'),
     path('clear-cart/', views.clear_cart, name='clear_cart'),
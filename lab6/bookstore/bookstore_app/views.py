@@ -1,19 +1,45 @@
 import json
 import os
-from datetime import datetime
-from decimal import Decimal
+import time
+from operator import attrgetter, itemgetter
 
+from django.conf import settings
 from django.contrib import messages
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, \
+    patch_cache_control
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_POST
 from django.views.generic import ListView
 
-from .models import Book
+from .analytics import get_bestsellers, get_daily_sales
+from .caching import get_cached_fragment, get_catalog_state, \
+    make_catalog_etag, make_catalog_key, set_cached_fragment
+from .carts import CartTooLarge, get_cart
+from .hashing import record_latency
+from .idempotency import idempotent, new_idempotency_key
+from .jobs import enqueue
+from .models import Book, Order
+from .orders import create_order, delete_orders, get_order_stats, \
+    import_legacy_orders
+from .pagination import CachedCountPaginator, KeysetPaginator, \
+    is_small_result
+from .pricing import get_cart_pricing, to_price
+from .renderers import ROW_FIELDS, BookRowRenderer
+from .search import get_search_backend, normalize_query
+from .serialization import dumps
+from .singleflight import catalog_flight
+from .suggest import get_suggest_index
 from .forms import BookForm, CustomRegisterForm, ProfileForm, \
     CustomPasswordChangeForm
 
@@ -26,27 +52,33 @@ def admin_permission_check(user):
     return user.is_authenticated and user.is_staff
 
 
-def get_cart_cookie_name(request):
-    if request.user.is_authenticated:
-        return f'cart_{request.user.username}'
-    return 'cart__'
-
-
 def get_orders_cookie_name(request):
+    # Прежнее хранилище заказов, см. orders.import_legacy_orders
     if request.user.is_authenticated:
         return f'orders_{request.user.username}'
     return 'orders__'
 
 
+BOOK_API_FIELDS = ('id', 'title', 'author', 'publisher', 'cost')
+
+
+def is_ajax(request):
+    return request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+
 def homepage_view(request):
     return HttpResponse("Hello, World!")
 
 
+# Токен CSRF для AJAX-запросов страница читает из cookie (см.
+# book_list.html), поэтому cookie нужна даже тем, кто не видел ни одной формы
+@method_decorator(ensure_csrf_cookie, name='dispatch')
 class BookListView(ListView):
     model = Book
     template_name = 'bookstore_app/templates/book_list.html'
     context_object_name = 'books'
     paginate_by = 10
+    paginator_class = CachedCountPaginator
 
     def dispatch(self, request, *args, **kwargs):
         if 'admin_required' in request.GET:
@@ -58,22 +90,227 @@ class BookListView(ListView):
         query = self.request.GET.get('q', '').strip()
         queryset = super().get_queryset()
         if query:
-            queryset = queryset.filter(
-                title__icontains=query).order_by('title')
-        return queryset
+            queryset = get_search_backend().search(
+                queryset, query, ranked=settings.BOOK_SEARCH_RANKED)
+        # Строки таблицы рендерит BookRowRenderer, модели не нужны
+        return queryset.values_list(*ROW_FIELDS)
+
+    def get_pagination_mode(self, queryset):
+        # Порядок по релевантности несовместим с ключом (title, id)
+        query = self.request.GET.get('q', '').strip()
+        if settings.BOOK_SEARCH_RANKED and query:
+            return 'numbered'
+        mode = settings.BOOK_LIST_PAGINATION
+        if mode != 'auto':
+            return mode
+        if self.request.GET.get('cursor'):
+            return 'keyset'
+        if is_small_result(
+                queryset, settings.BOOK_LIST_NUMBERED_MAX_ROWS,
+                count_key=self.get_count_key(),
+                catalog_version=self.catalog_version):
+            return 'numbered'
+        return 'keyset'
+
+    def get_count_key(self):
+        # Число строк кэшируется по нормализованному запросу
+        return normalize_query(self.request.GET.get('q', ''))
+
+    def get_paginator(self, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True, **kwargs):
+        return super().get_paginator(
+            queryset, per_page, orphans, allow_empty_first_page,
+            count_key=self.get_count_key(),
+            catalog_version=self.catalog_version, **kwargs)
+
+    def paginate_queryset(self, queryset, page_size):
+        if not settings.BOOK_SINGLEFLIGHT_TIMEOUT:
+            self.pagination_mode, result = self.fetch_page(
+                queryset, page_size)
+            return result
+        # Одинаковые одновременные запросы ждут результат первого из них
+        params = self.request.GET
+        key = make_catalog_key(
+            'book_list_page', normalize_query(params.get('q', '')),
+            params.get('page', ''), params.get('cursor', ''), page_size,
+            version=self.catalog_version)
+        self.pagination_mode, result = catalog_flight.do(
+            key, lambda: self.fetch_page(queryset, page_size),
+            timeout=settings.BOOK_SINGLEFLIGHT_TIMEOUT)
+        return result
+
+    def fetch_page(self, queryset, page_size):
+        """Выполняет запросы страницы (строки и, для нумерованного
+        режима, COUNT) и возвращает (режим, результат paginate_queryset)."""
+        mode = self.get_pagination_mode(queryset)
+        if mode == 'numbered':
+            paginator, page, object_list, is_paginated = \
+                super().paginate_queryset(queryset, page_size)
+            page.object_list = list(page.object_list)
+            return mode, (paginator, page, page.object_list, is_paginated)
+        paginator = KeysetPaginator(queryset, page_size,
+                                    key=itemgetter(1, 0))
+        page = paginator.page(self.request.GET.get('cursor'))
+        return mode, (paginator, page, page.object_list,
+                      page.has_other_pages())
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['query'] = self.request.GET.get('q', '')
+        context['pagination_mode'] = getattr(self, 'pagination_mode',
+                                             'numbered')
+        context['book_rows'] = BookRowRenderer(
+            self.request.user.is_staff).render(context['object_list'])
         return context
 
+    def is_fragment_request(self):
+        return is_ajax(self.request)
+
+    def get_fragment_cache_key(self):
+        params = self.request.GET
+        return make_catalog_key(
+            'book_list_fragment', normalize_query(params.get('q', '')),
+            params.get('page', ''), params.get('cursor', ''),
+            self.request.user.is_staff, version=self.catalog_version)
+
+    def get_etag(self):
+        # Полная страница содержит имя пользователя, поэтому зависит от него
+        params, user = self.request.GET, self.request.user
+        return make_catalog_etag(
+            self.is_fragment_request(), normalize_query(params.get('q', '')),
+            params.get('page', ''), params.get('cursor', ''), user.pk,
+            user.is_staff, getattr(user, 'first_name', ''),
+            version=self.catalog_version)
+
+    def get(self, request, *args, **kwargs):
+        # Версия каталога читается один раз на запрос: из неё строятся ETag
+        # и все ключи кэша, так что они согласованы между собой
+        self.catalog_version, last_modified = get_catalog_state()
+        # Сообщения показываются один раз, ответ с ними нельзя заменять 304
+        if len(messages.get_messages(request)):
+            return super().get(request, *args, **kwargs)
+
+        etag = self.get_etag()
+        response = get_conditional_response(
+            request, etag=quote_etag(etag), last_modified=last_modified)
+        if response is None:
+            response = self.get_uncached(request, *args, **kwargs)
+        response.headers['ETag'] = quote_etag(etag)
+        response.headers['Last-Modified'] = http_date(last_modified)
+        # Клиент хранит копию, но перепроверяет её при каждом запросе
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def get_uncached(self, request, *args, **kwargs):
+        # Попадание в кэш фрагмента не выполняет запросов страницы и не
+        # рендерит шаблоны. Ключ вычисляется один раз: фрагмент, собранный
+        # ниже, сохраняется под той версией, при которой его искали
+        self.fragment_cache_key = None
+        if self.is_fragment_request() and settings.BOOK_FRAGMENT_CACHE_TIMEOUT:
+            self.fragment_cache_key = self.get_fragment_cache_key()
+            html = get_cached_fragment(self.fragment_cache_key)
+            if html is not None:
+                return HttpResponse(html)
+        return super().get(request, *args, **kwargs)
+
     def render_to_response(self, context, **response_kwargs):
-        if self.request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return HttpResponse(render_to_string(
-                'bookstore_app/book_list_fragment.html', context))
+        if self.is_fragment_request():
+            html = render_to_string('bookstore_app/book_list_fragment.html',
+                                    context, request=self.request)
+            if getattr(self, 'fragment_cache_key', None):
+                set_cached_fragment(self.fragment_cache_key, html,
+                                    settings.BOOK_FRAGMENT_CACHE_TIMEOUT)
+            return HttpResponse(html)
         return super().render_to_response(context, **response_kwargs)
 
 
+def book_list_api(request):
+    """JSON-версия каталога. Строки выбираются через values_list без
+    создания моделей и отдаются компактно: список полей fields и массив
+    строк rows. Поддерживаются q, cursor, limit и fields=title,cost."""
+    fields = request.GET.get('fields')
+    fields = list(dict.fromkeys(fields.split(','))) if fields \
+        else list(BOOK_API_FIELDS)
+    unknown = set(fields) - set(BOOK_API_FIELDS)
+    if unknown:
+        return JsonResponse({'error': 'Неизвестные поля: '
+                                      + ', '.join(sorted(unknown))},
+                            status=400)
+    try:
+        limit = int(request.GET.get('limit', settings.BOOK_API_PAGE_SIZE))
+    except ValueError:
+        limit = settings.BOOK_API_PAGE_SIZE
+    limit = max(1, min(limit, settings.BOOK_API_MAX_PAGE_SIZE))
+
+    queryset = Book.objects.all()
+    query = request.GET.get('q', '').strip()
+    if query:
+        queryset = get_search_backend().search(queryset, query)
+
+    # id и title нужны для курсора, поэтому выбираются всегда и идут первыми
+    columns = ['id', 'title'] + [field for field in fields
+                                 if field not in ('id', 'title')]
+    paginator = KeysetPaginator(queryset.values_list(*columns), limit,
+                                key=itemgetter(1, 0))
+    page = paginator.page(request.GET.get('cursor'))
+    if fields == columns:
+        rows = page.object_list
+    else:
+        positions = [columns.index(field) for field in fields]
+        rows = [[row[i] for i in positions] for row in page.object_list]
+
+    return HttpResponse(dumps({
+        'fields': fields,
+        'rows': rows,
+        'next': page.next_cursor or None,
+        'previous': page.previous_cursor or None,
+    }), content_type='application/json')
+
+
+def bestsellers(request):
+    """Самые продаваемые книги за BOOK_BESTSELLERS_DAYS дней по сводке
+    продаж (не больше BOOK_BESTSELLERS_DAYS строк на книгу)."""
+    books = cache.get_or_set(
+        'bookstore:bestsellers',
+        lambda: [dict(book, revenue=format_money(book['revenue']))
+                 for book in get_bestsellers(settings.BOOK_BESTSELLERS_DAYS,
+                                             settings.BOOK_BESTSELLERS_LIMIT)],
+        settings.BOOK_BESTSELLERS_CACHE_TIMEOUT)
+    return HttpResponse(dumps({'bestsellers': books}),
+                        content_type='application/json')
+
+
+@login_required
+@user_passes_test(admin_permission_check, login_url="book_list",
+                  redirect_field_name="admin_required")
+def sales_report(request):
+    try:
+        days = int(request.GET.get('days', settings.BOOK_BESTSELLERS_DAYS))
+    except ValueError:
+        days = settings.BOOK_BESTSELLERS_DAYS
+    days = max(1, min(days, settings.BOOK_SALES_COMPACT_DAYS))
+    daily = get_daily_sales(days)
+    return render(request, 'bookstore_app/sales_report.html', {
+        'days': days,
+        'daily': daily,
+        'total_quantity': sum(row['total_quantity'] for row in daily),
+        'total_revenue': sum(row['total_revenue'] for row in daily),
+        'books': get_bestsellers(days, limit=50),
+    })
+
+
+def suggest(request):
+    """Подсказки по префиксу названия или автора из индекса в памяти."""
+    try:
+        limit = int(request.GET.get('limit', settings.BOOK_SUGGEST_LIMIT))
+    except ValueError:
+        limit = settings.BOOK_SUGGEST_LIMIT
+    limit = max(1, min(limit, settings.BOOK_SUGGEST_LIMIT))
+    suggestions = get_suggest_index().lookup(request.GET.get('q', ''), limit)
+    return HttpResponse(dumps({'suggestions': suggestions}),
+                        content_type='application/json')
+
+
 @login_required
 def add_book(request):
     if request.method == 'POST':
@@ -128,19 +365,25 @@ def register(request):
 
 
 def login_view(request):
-    if request.method == 'POST':
-        form = AuthenticationForm(request, data=request.POST)
-        if form.is_valid():
-            username = form.cleaned_data.get('username')
-            password = form.cleaned_data.get('password')
-            user = authenticate(username=username, password=password)
-            if user is not None:
-                login(request, user)
-                return redirect('book_list')
-        messages.error(request, 'Неверное имя пользователя или пароль.')
+    if request.method != 'POST':
+        return render(request, 'bookstore_app/login.html',
+                      {'form': AuthenticationForm()})
+    form = AuthenticationForm(request, data=request.POST)
+    # is_valid() вызывает authenticate() и проверяет пароль; найденного
+    # пользователя отдаёт get_user(), второй раз пароль не хэшируется
+    started = time.perf_counter()
+    is_valid = form.is_valid()
+    auth_time = time.perf_counter() - started
+    record_latency('auth', auth_time)
+    if is_valid:
+        login(request, form.get_user())
+        response = redirect('book_list')
     else:
-        form = AuthenticationForm()
-    return render(request, 'bookstore_app/login.html', {'form': form})
+        messages.error(request, 'Неверное имя пользователя или пароль.')
+        response = render(request, 'bookstore_app/login.html',
+                          {'form': form})
+    response['Server-Timing'] = f'auth;dur={auth_time * 1000:.1f}'
+    return response
 
 
 def logout_view(request):
@@ -183,167 +426,259 @@ def profile(request):
     return render(request, 'bookstore_app/profile.html', {
         'profile_form': profile_form,
         'password_form': password_form,
+        'order_stats': get_order_stats(request.user),
     })
 
 
-def add_to_cart(request, book_id):
-    book = get_object_or_404(Book, id=book_id)
-    cart_cookie_name = get_cart_cookie_name(request)
-    print(f"atc {cart_cookie_name = }")
-    cart = request.COOKIES.get(cart_cookie_name, '{}')
-    try:
-        cart = json.loads(cart)
-    except json.JSONDecodeError:
-        cart = {}
+def format_money(value):
+    # Как floatformat:2 в cart.html
+    return f'{value:.2f}'
+
+
+def cart_delta_response(request, cart, book_id=None, message=''):
+    """JSON-ответ AJAX-варианта действия с корзиной: изменённая строка
+    (None, если книги в корзине больше нет), итоговая стоимость и число
+    экземпляров. Вместо перенаправления и перерисовки всей страницы клиент
+    обновляет только эти значения."""
+    priced = get_cart_pricing(request).price_cart(cart)
+    line = next((item for item in priced.lines
+                 if item['book_id'] == book_id), None)
+    if line is not None:
+        line = dict(line, cost=format_money(line['cost']),
+                    total_item_cost=format_money(line['total_item_cost']),
+                    previous_cost=line['previous_cost'] and
+                    format_money(line['previous_cost']))
+    response = JsonResponse({
+        'book_id': book_id,
+        'line': line,
+        'total_cost': format_money(priced.total_cost),
+        'item_count': sum(item['quantity'] for item in priced.lines),
+        'message': message,
+    })
+    cart.save(response)
+    return response
+
+
+def cart_error_response(request, message, status=400):
+    if is_ajax(request):
+        return JsonResponse({'error': message}, status=status)
+    messages.error(request, message)
+    return redirect('cart')
 
-    book_id_str = str(book_id)
-    if book_id_str in cart:
-        cart[book_id_str]['quantity'] += 1
-    else:
-        cart[book_id_str] = {
-            'quantity': 1,
-            'title': book.title,
-            'author': book.author,
-            'cost': str(book.cost) if book.cost else '0.00',
-        }
-
-    cart_json = json.dumps(cart)
-    if len(cart_json.encode('utf-8')) > 4096:  # Ограничение 4 КБ
-        messages.error(request, 'Корзина слишком большая. '
-                                'Пожалуйста, удалите некоторые элементы.')
-        return redirect('cart')
 
+@idempotent
+def add_to_cart(request, book_id):
+    if is_ajax(request):
+        book = Book.objects.filter(pk=book_id).only('title', 'cost').first()
+        if book is None:
+            return JsonResponse({'error': 'Книга не найдена.'}, status=404)
+    else:
+        book = get_object_or_404(Book, id=book_id)
+    cart = get_cart(request)
+    try:
+        cart.add(book_id, price=to_price(book.cost))
+    except CartTooLarge:
+        return cart_error_response(request, 'Корзина слишком большая. '
+                                   'Пожалуйста, удалите некоторые элементы.')
+
+    if is_ajax(request):
+        return cart_delta_response(
+            request, cart, book_id,
+            f'Книга "{book.title}" добавлена в корзину!')
     response = redirect('book_list')
-    response.set_cookie(cart_cookie_name, json.dumps(cart),
-                        max_age=30 * 24 * 60 * 60)  # 30 дней
+    cart.save(response)
     messages.success(request, f'Книга "{book.title}" добавлена в корзину!')
     return response
 
 
-def remove_from_cart(request, book_id):
-    cart_cookie_name = get_cart_cookie_name(request)
-    print(f"rfc {cart_cookie_name = }")
-    cart = request.COOKIES.get(cart_cookie_name, '{}')
-    try:
-        cart = json.loads(cart)
-    except json.JSONDecodeError:
-        cart = {}
-
-    book_id_str = str(book_id)
-    if book_id_str in cart:
-        book_title = cart[book_id_str]['title']
-        del cart[book_id_str]
-        messages.success(request, f'Книга "{book_title}" удалена из корзины!')
+def parse_cart_batch(request):
+    """Достаёт пары (book_id, quantity) из тела запроса: JSON
+    {"items": [{"book_id": 1, "quantity": 2}, ...]} или поля формы
+    book_id/quantity, повторённые нужное число раз. Одинаковые книги
+    складываются. Возвращает {book_id: quantity}; ValueError при ошибке."""
+    if request.content_type == 'application/json':
+        try:
+            items = json.loads(request.body)['items']
+            pairs = [(item['book_id'], item.get('quantity', 1))
+                     for item in items]
+        except (ValueError, TypeError, KeyError, AttributeError):
+            raise ValueError('Ожидается JSON вида {"items": [{"book_id": ..., '
+                             '"quantity": ...}]}')
     else:
-        messages.error(request, 'Книга не найдена в корзине.')
+        book_ids = request.POST.getlist('book_id')
+        quantities = request.POST.getlist('quantity') or ['1'] * len(book_ids)
+        if len(quantities) != len(book_ids):
+            raise ValueError('Число значений quantity не совпадает с book_id')
+        pairs = zip(book_ids, quantities)
+
+    result = {}
+    for book_id, quantity in pairs:
+        if isinstance(book_id, bool) or isinstance(quantity, bool):
+            raise ValueError('book_id и quantity должны быть целыми числами')
+        try:
+            book_id, quantity = int(book_id), int(quantity)
+        except (TypeError, ValueError):
+            raise ValueError('book_id и quantity должны быть целыми числами')
+        if quantity <= 0:
+            raise ValueError('quantity должно быть положительным')
+        result[book_id] = result.get(book_id, 0) + quantity
+    if not result:
+        raise ValueError('Не передано ни одной книги')
+    if len(result) > settings.BOOK_CART_BATCH_LIMIT:
+        raise ValueError('Слишком много книг в одном запросе (больше '
+                         f'{settings.BOOK_CART_BATCH_LIMIT})')
+    return result
+
+
+@require_POST
+@idempotent
+def add_to_cart_batch(request):
+    """Добавляет в корзину сразу много книг. Все id проверяются одним
+    запросом, корзина записывается один раз. Если какой-то книги нет
+    в каталоге, ничего не добавляется и возвращается 400 со списком
+    missing."""
+    try:
+        quantities = parse_cart_batch(request)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    # Цены нужны для снимков в корзине, так что проверка их и загружает
+    prices = get_cart_pricing(request).prices(list(quantities))
+    missing = sorted(set(quantities) - set(prices))
+    if missing:
+        return JsonResponse({'error': 'Книги не найдены', 'missing': missing},
+                            status=400)
+
+    cart = get_cart(request)
+    try:
+        cart.add_many(quantities, prices)
+    except CartTooLarge:
+        return JsonResponse({'error': 'Корзина слишком большая. Пожалуйста, '
+                                      'удалите некоторые элементы.'},
+                            status=400)
+
+    response = JsonResponse({
+        'added': sum(quantities.values()),
+        'books': len(quantities),
+        'item_count': len(cart),
+    })
+    cart.save(response)
+    return response
+
+
+@idempotent
+def remove_from_cart(request, book_id):
+    cart = get_cart(request)
+    if book_id not in cart:
+        return cart_error_response(request, 'Книга не найдена в корзине.',
+                                   status=404)
+    book_title = Book.objects.filter(pk=book_id).values_list(
+        'title', flat=True).first()
+    cart.remove(book_id)
+    message = f'Книга "{book_title}" удалена из корзины!'
+    if is_ajax(request):
+        return cart_delta_response(request, cart, book_id, message)
+    messages.success(request, message)
 
     response = redirect('cart')
-    response.set_cookie(cart_cookie_name, json.dumps(cart),
-                        max_age=30 * 24 * 60 * 60)
+    cart.save(response)
     return response
 
 
+@idempotent
 def cart_view(request):
-    cart_cookie_name = get_cart_cookie_name(request)
-    print(f"cv {cart_cookie_name = }")
-    cart = request.COOKIES.get(cart_cookie_name, '{}')
-    try:
-        cart = json.loads(cart)
-    except json.JSONDecodeError:
-        cart = {}
-    print(f"{cart = }")
+    cart = get_cart(request)
 
     if request.method == 'POST':
-        book_id = request.POST.get('book_id')
-        quantity = int(request.POST.get('quantity', 1))
-        book_id_str = str(book_id)
-
-        if book_id_str in cart:
+        try:
+            book_id = int(request.POST.get('book_id'))
+            quantity = int(request.POST.get('quantity', 1))
+        except (TypeError, ValueError):
+            if is_ajax(request):
+                return JsonResponse({'error': 'Неверные данные.'},
+                                    status=400)
+            return redirect('cart')
+
+        if book_id in cart:
+            book_title = Book.objects.filter(pk=book_id).values_list(
+                'title', flat=True).first()
+            try:
+                cart.set(book_id, quantity)
+            except CartTooLarge:
+                return cart_error_response(request,
+                                           'Корзина слишком большая. '
+                                           'Пожалуйста, удалите некоторые '
+                                           'элементы.')
             if quantity > 0:
-                cart[book_id_str]['quantity'] = quantity
-                messages.success(request,
-                                 f'Количество для "{cart[book_id_str]["title"]}" обновлено!')
+                message = f'Количество для "{book_title}" обновлено!'
             else:
-                book_title = cart[book_id_str]['title']
-                del cart[book_id_str]
-                messages.success(request,
-                                 f'Книга "{book_title}" удалена из корзины!')
+                message = f'Книга "{book_title}" удалена из корзины!'
+            if is_ajax(request):
+                return cart_delta_response(request, cart, book_id, message)
+            messages.success(request, message)
             response = redirect('cart')
-            response.set_cookie('cart', json.dumps(cart),
-                                max_age=30 * 24 * 60 * 60)
+            cart.save(response)
             return response
 
-    cart_items = []
-    total_cost = Decimal('0.00')
-
-    for book_id, item in cart.items():
-        item_cost = Decimal(item['cost']) * item['quantity']
-        cart_items.append({
-            'book_id': book_id,
-            'title': item['title'],
-            'quantity': item['quantity'],
-            'cost': item['cost'],
-            'total_item_cost': item_cost,
-        })
-        total_cost += item_cost
-
-    return render(request, 'bookstore_app/cart.html', {
-        'cart_items': cart_items,
-        'total_cost': total_cost,
+        elif is_ajax(request):
+            return JsonResponse({'error': 'Книга не найдена в корзине.'},
+                                status=404)
+
+    priced = get_cart_pricing(request).price_cart(cart)
+    response = render(request, 'bookstore_app/cart.html', {
+        'cart_items': priced.lines,
+        'total_cost': priced.total_cost,
+        'item_count': sum(item['quantity'] for item in priced.lines),
+        'prices_changed': bool(priced.changed),
+        # Повторная отправка формы или ссылки с этим ключом не выполняется
+        # второй раз (см. idempotency.py)
+        'idempotency_key': new_idempotency_key(),
     })
+    if priced.changed:
+        # Новые цены показаны, повторно они помечаться не будут
+        cart.remember_prices({line['book_id']: line['cost']
+                              for line in priced.changed})
+    cart.save(response)
+    return response
 
 
+@idempotent
 def clear_cart(request):
-    cart_cookie_name = get_cart_cookie_name(request)
+    cart = get_cart(request)
+    cart.clear()
+    if is_ajax(request):
+        return cart_delta_response(request, cart, message='Корзина очищена!')
     response = redirect('cart')
-    response.delete_cookie(cart_cookie_name)
+    cart.save(response)
     messages.success(request, 'Корзина очищена!')
     return response
 
 
+@require_POST
 @login_required
+@idempotent
 def place_order(request):
-    cart_cookie_name = get_cart_cookie_name(request)
-    cart = request.COOKIES.get(cart_cookie_name, '{}')
-    try:
-        cart = json.loads(cart)
-    except json.JSONDecodeError:
-        cart = {}
+    cart = get_cart(request)
+    cart_items, total_cost, changed = \
+        get_cart_pricing(request).price_cart(cart)
 
-    if not cart:
+    if not cart_items:
         messages.error(request, 'Ваша корзина пуста. Нельзя оформить заказ.')
         return redirect('cart')
-
-    total_cost = Decimal('0.00')
-    for book_id, item in cart.items():
-        item_cost = Decimal(item['cost']) * item['quantity']
-        total_cost += item_cost
-
-    order = {
-        'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'items': cart,
-        'total_cost': str(total_cost),
-    }
-
-    orders_cookie_name = get_orders_cookie_name(request)
-    orders = request.COOKIES.get(orders_cookie_name, '[]')
-    try:
-        orders = json.loads(orders)
-    except json.JSONDecodeError:
-        orders = []
-
-    orders.append(order)
-
-    orders_json = json.dumps(orders)
-    if len(orders_json.encode('utf-8')) > 4096:
-        messages.error(request, 'Слишком много заказов. '
-                                'Пожалуйста, очистите историю заказов.')
+    if changed:
+        # Заказ по ценам, которых покупатель не видел, не оформляется
+        messages.error(request, 'Цены на некоторые книги изменились. '
+                                'Проверьте корзину и оформите заказ снова.')
         return redirect('cart')
 
+    # Заказ, задачи для него и очистка корзины — одна короткая транзакция;
+    # письмо и прочая последующая работа выполняются командой run_jobs
+    with transaction.atomic():
+        order = create_order(request.user, cart_items, total_cost)
+        enqueue('order_confirmation', {'order_id': order.pk})
+        cart.clear()
     response = redirect('order_history')
-    response.delete_cookie(cart_cookie_name)
-    response.set_cookie(orders_cookie_name, orders_json,
-                        max_age=365 * 24 * 60 * 60)  # Заказы хранятся 1 год
+    cart.save(response)
     messages.success(request, 'Заказ успешно оформлен!')
     return response
 
@@ -351,27 +686,35 @@ def place_order(request):
 @login_required
 def order_history(request):
     orders_cookie_name = get_orders_cookie_name(request)
-    orders = request.COOKIES.get(orders_cookie_name, '[]')
-    try:
-        orders = json.loads(orders)
-    except json.JSONDecodeError:
-        orders = []
-
-    for order in orders:
-        order['total_cost'] = Decimal(order['total_cost'])
-        for item in order['items'].values():
-            item['cost'] = Decimal(item['cost'])
-
-    return render(request, 'bookstore_app/order_history.html', {
-        'orders': orders,
+    legacy_orders = request.COOKIES.get(orders_cookie_name)
+    if legacy_orders:
+        import_legacy_orders(request.user, legacy_orders)
+
+    # Страница по ключу (created_at, id) индекса order_user_created_idx,
+    # строки всех заказов страницы загружаются одним запросом
+    paginator = KeysetPaginator(
+        Order.objects.filter(user=request.user, deleted_at=None)
+        .prefetch_related('items'),
+        settings.BOOK_ORDER_HISTORY_PAGE_SIZE,
+        key=attrgetter('created_at', 'pk'), field='created_at',
+        descending=True)
+    page = paginator.page(request.GET.get('cursor'))
+    response = render(request, 'bookstore_app/order_history.html', {
+        'orders': page.object_list,
+        'page_obj': page,
+        'order_stats': get_order_stats(request.user),
     })
+    if legacy_orders:
+        response.delete_cookie(orders_cookie_name)
+    return response
 
 
+@require_POST
 @login_required
 def clear_orders(request):
-    orders_cookie_name = get_orders_cookie_name(request)
+    delete_orders(request.user)
     response = redirect('order_history')
-    response.delete_cookie(orders_cookie_name)
+    response.delete_cookie(get_orders_cookie_name(request))
     messages.success(request, 'История заказов очищена!')
     return response
 